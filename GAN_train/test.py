@@ -13,14 +13,17 @@
 
 import torch
 import numpy as np
-import data_processing as dp
+from utils.dataset_cache import CachedDatasetReader
 import argparse
 import json
 from models.Generator import Generator
 from models.Discriminator import Discriminator
+from models.registry import file_name, checkpoint_path, load_state_dict
+from utils import reference_bank
 
 
 data_path = './data/data_processed'
+cache_path = './data/cache'
 info_path = './data/info'
 save_path = './results'
 
@@ -32,11 +35,12 @@ class DamageDetection:
         torch.manual_seed(self.args.seed)
         np.random.seed(self.args.seed)
         print('{} detection...'.format(args.dataset))
-        white_noise = dp.DatasetReader(white_noise=self.args.dataset,
-                                       data_path=data_path,
-                                       len_seg=self.args.len_seg
-                                       )
-        self.testset = torch.tensor(torch.from_numpy(white_noise.dataset_), dtype=torch.float32)
+        white_noise = CachedDatasetReader(white_noise=self.args.dataset,
+                                          data_path=data_path,
+                                          cache_path=cache_path,
+                                          len_seg=self.args.len_seg
+                                          )
+        self.testset = torch.from_numpy(white_noise.dataset_).float()
         self.spots = np.load('{}/spots.npy'.format(info_path))
         self.Generator = Generator(args)  # Generator
         self.Discriminator = Discriminator(args)  # Discriminator
@@ -45,43 +49,83 @@ class DamageDetection:
         self.test()
 
     def file_name(self):
-        return '{}_{}_{}_{}_{}_{}'.format(self.args.model_name,
-                                          self.args.net_name,
-                                          self.args.len_seg,
-                                          self.args.optimizer,
-                                          self.args.learning_rate,
-                                          self.args.num_epoch
-                                          )
+        return file_name(self.args)
+
+    def bank_path(self):
+        return '{}/features/{}_bank{}.npy'.format(save_path, self.file_name(), self.args.bank_size)
+
+    def load_bank(self):
+        """
+        Bank of generated healthy spectra and their Discriminator scores, built
+        once per trained Generator and memory-mapped from disk afterwards.
+        Rebuilt when the checkpoints or the seed no longer match its fingerprint
+        """
+        path = self.bank_path()
+        fingerprint = reference_bank.fingerprint((checkpoint_path(self.args, 'Gen'),
+                                                  checkpoint_path(self.args, 'Dis')),
+                                                 self.args.bank_size, self.args.seed)
+        if not reference_bank.is_current(path, fingerprint):
+            print('> Building a reference bank of {} spectra'.format(self.args.bank_size))
+            reference_bank.build(self.Generator, self.Discriminator, path,
+                                 size=self.args.bank_size,
+                                 dim_noise=self.args.dim_noise,
+                                 seed=self.args.seed,
+                                 fingerprint=fingerprint
+                                 )
+        return reference_bank.load(path)
+
+    def score_random(self, i):
+        """
+        Residual against a fresh generated batch, compared elementwise
+        """
+        z = torch.randn(self.testset.shape[1], self.args.dim_noise)
+        data_gen = self.Generator(z)
+        data_real = self.testset[i]
+        res = ((data_gen - data_real) ** 2).mean()
+        dis = self.Discriminator(data_gen).mean() - 1
+        return res.item(), dis.item()
+
+    def score_bank(self, i, bank, scores):
+        """
+        Mean residual of the segments to their nearest bank references, and
+        the Discriminator scores of those references
+        """
+        res, index = reference_bank.nearest(self.testset[i], bank, chunk_size=self.args.bank_chunk)
+        dis = scores[np.sort(index.numpy())].mean() - 1
+        return res.mean().item(), float(dis)
 
     def test(self):
-        path_gen = '{}/models/{}_Gen.model'.format(save_path, self.file_name())
-        path_dis = '{}/models/{}_Dis.model'.format(save_path, self.file_name())
-        self.Generator.load_state_dict(torch.load(path_gen))  # Load Generator
-        self.Discriminator.load_state_dict(torch.load(path_dis))  # Load Discriminator
+        path_gen = checkpoint_path(self.args, 'Gen')
+        path_dis = checkpoint_path(self.args, 'Dis')
+        self.Generator.load_state_dict(load_state_dict(path_gen))  # Load Generator
+        self.Discriminator.load_state_dict(load_state_dict(path_dis))  # Load Discriminator
         self.Generator.eval()
         self.Discriminator.eval()
         damage_indices = {}
         beta = 0.5
         with torch.no_grad():
+            if self.args.scoring == 'bank':
+                bank, scores = self.load_bank()
             for i, spot in enumerate(self.spots):
                 damage_indices[spot] = {}
-                z = torch.randn(self.testset.shape[1], 50)
-                data_gen = self.Generator(z)
-                data_real = self.testset[i]
-                res = ((data_gen - data_real) ** 2).mean()
-                dis = self.Discriminator(data_gen).mean() - 1
-                loss = beta * res.item() + (1 - beta) * np.abs(dis.item())
-                damage_indices[spot]['Generate residual'] = res.item()
-                damage_indices[spot]['Discriminate loss'] = np.abs(dis.item())
+                if self.args.scoring == 'bank':
+                    res, dis = self.score_bank(i, bank, scores)
+                else:
+                    res, dis = self.score_random(i)
+                loss = beta * res + (1 - beta) * np.abs(dis)
+                damage_indices[spot]['Generate residual'] = res
+                damage_indices[spot]['Discriminate loss'] = np.abs(dis)
                 damage_indices[spot]['Loss'] = loss
                 print('[{}]\tGenerate residual: {:5f}\tDiscriminate loss: {:5f}\tLoss: {:5f}'.
-                      format(spot, res.item(), np.abs(dis.item()), loss)
+                      format(spot, res, np.abs(dis), loss)
                       )
         damage_indices = json.dumps(damage_indices, indent=2)
-        with open('{}/damage index/{}_{}.json'.format(save_path,
-                                                      self.args.dataset,
-                                                      self.file_name()
-                                         ), 'w') as f:
+        # Bank scores are not comparable with the random ones, so they get their own file
+        with open('{}/damage index/{}_{}{}.json'.format(save_path,
+                                                        self.args.dataset,
+                                                        self.file_name(),
+                                                        '_bank' if self.args.scoring == 'bank' else ''
+                                           ), 'w') as f:
             f.write(damage_indices)
 
 
@@ -100,6 +144,10 @@ def main():
     parser.add_argument('--seed', default=1993, type=int)
     parser.add_argument('--num_epoch', default=100, type=int)
     parser.add_argument('--learning_rate', default=1e-2, type=float)
+    # random: fresh batch per spot, bank: nearest reference in a persisted bank of generated spectra
+    parser.add_argument('--scoring', default='random', type=str)
+    parser.add_argument('--bank_size', default=16384, type=int)
+    parser.add_argument('--bank_chunk', default=4096, type=int)
     args = parser.parse_args()
     detector = DamageDetection(args)
     detector()
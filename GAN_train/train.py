@@ -12,43 +12,52 @@
 
 
 import torch
-from torch.utils.data import DataLoader
 from torch import nn, optim, autograd
 import numpy as np
 import matplotlib.pyplot as plt
-import data_processing as dp
+from utils.dataset_cache import CachedDatasetReader
+from utils.batching import TensorBatches
+from utils.profiler import make_profiler
 import time
 import json
 import argparse
 from models.Generator import Generator
 from models.Discriminator import Discriminator
+from models.registry import file_name
 
 
 data_path = './data/data_processed'
+cache_path = './data/cache'
 save_path = './results'
 
 
 class BaseExperiment:
 
-    def __init__(self, args):
+    def __init__(self, args, dataset=None):
         self.args = args
         torch.manual_seed(self.args.seed)
         np.random.seed(self.args.seed)
         print('> Training arguments:')
         for arg in vars(args):
             print('>>> {}: {}'.format(arg, getattr(args, arg)))
-        white_noise = dp.DatasetReader(white_noise=self.args.dataset,
-                                       data_path=data_path,
-                                       data_source=args.data,
-                                       len_seg=self.args.len_seg
-                                       )
-        dataset, _ = white_noise(args.net_name)
-        self.data_loader = DataLoader(dataset=dataset,
-                                      batch_size=args.batch_size,
-                                      shuffle=True
-                                      )
+        if dataset is None:
+            white_noise = CachedDatasetReader(white_noise=self.args.dataset,
+                                              data_path=data_path,
+                                              cache_path=cache_path,
+                                              data_source=args.data,
+                                              len_seg=self.args.len_seg
+                                              )
+            dataset, _ = white_noise(args.net_name)
+        self.data_loader = TensorBatches(dataset=dataset,
+                                         batch_size=args.batch_size,
+                                         shuffle=True
+                                         )
         self.Generator = Generator(args)  # Generator
         self.Discriminator = Discriminator(args)  # Discriminator
+        self.critic_steps = 0
+        self.profiler = make_profiler(args.profile, args.profile_epochs,
+                                      trace_path='{}/profiles/{}.json'.format(save_path, self.file_name())
+                                      )
 
     def select_optimizer(self, model):
         if self.args.optimizer == 'Adam':
@@ -87,13 +96,7 @@ class BaseExperiment:
             model.bias.data.fill_(0)
 
     def file_name(self):
-        return '{}_{}_{}_{}_{}_{}'.format(self.args.model_name,
-                                          self.args.net_name,
-                                          self.args.len_seg,
-                                          self.args.optimizer,
-                                          self.args.learning_rate,
-                                          self.args.num_epoch
-                                          )
+        return file_name(self.args)
 
     def gradient_penalty(self, x_real, x_fake, batch_size, beta=0.3):
         x_real = x_real.detach()
@@ -105,70 +108,99 @@ class BaseExperiment:
         dis_interpolates = self.Discriminator(interpolates)
         gradients = autograd.grad(outputs=dis_interpolates, inputs=interpolates,
                                   grad_outputs=torch.ones_like(dis_interpolates),
-                                  create_graph=True, retain_graph=True, only_inputs=True)[0]
+                                  create_graph=True, only_inputs=True)[0]
         grad_penalty = ((gradients.norm(2, dim=1) - 1) ** 2).mean() * beta
         return grad_penalty
 
+    def train_batch(self, data_real, gen_optimizer, dis_optimizer):
+        """
+        n_critic Discriminator updates then one Generator update on a batch.
+        The fakes of all critic updates come from one batched Generator call,
+        real and fake samples go through the Discriminator in one forward
+        (MLP_D has no BatchNorm, so this equals two separate forwards) and the
+        WGAN gradient penalty is only computed every gp_every critic updates,
+        scaled by gp_every to keep its average weight (lazy regularization)
+        :return: loss_real, dis_loss, gen_loss and the Generator's fake batch
+        """
+        batch_size = data_real.size(0)
+        # 1. Train Discriminator: maximize log(D(x)) + log(1 - D(G(z)))
+        self.requires_grad(self.Discriminator, True)
+        with self.profiler.phase('fakes'), torch.no_grad():
+            z = torch.randn(self.args.n_critic * batch_size, self.args.dim_noise)
+            data_fakes = self.Generator(z).view(self.args.n_critic, batch_size, -1)
+        for data_fake in data_fakes:
+            with self.profiler.phase('critic'):
+                pred = self.Discriminator(torch.cat([data_real, data_fake]))
+                loss_real = - pred[:batch_size].mean()
+                loss_fake = pred[batch_size:].mean()
+                # Discriminator loss
+                dis_loss = loss_real + loss_fake
+                if self.args.model_name == 'WGAN' and self.critic_steps % self.args.gp_every == 0:
+                    with self.profiler.phase('gradient penalty'):
+                        grad_penalty = self.gradient_penalty(data_real, data_fake, batch_size)
+                    dis_loss = dis_loss + grad_penalty * self.args.gp_every
+                dis_optimizer.zero_grad()
+                dis_loss.backward()
+                dis_optimizer.step()
+            self.critic_steps += 1
+        # 2. Train Generator: maximize log(D(G(z))), on a fresh batch with its graph
+        self.requires_grad(self.Discriminator, False)
+        with self.profiler.phase('generator'):
+            z = torch.randn(batch_size, self.args.dim_noise)
+            data_fake = self.Generator(z)
+            gen_loss = - self.Discriminator(data_fake).mean()
+            gen_optimizer.zero_grad()
+            gen_loss.backward()
+            gen_optimizer.step()
+        return loss_real.detach(), dis_loss.detach(), gen_loss.detach(), data_fake.detach()
+
+    @staticmethod
+    def requires_grad(model, flag):
+        for p in model.parameters():
+            p.requires_grad_(flag)
+
     def train(self):
         self.Generator.apply(self.weights_init)
         self.Discriminator.apply(self.weights_init)
         gen_optimizer = self.select_optimizer(self.Generator)
-        dis_optimizer = self.select_optimizer(self.Generator)
+        dis_optimizer = self.select_optimizer(self.Discriminator)
         losses = {}
         criterion = nn.MSELoss()
         dis_losses, gen_losses = [0], [0]
         for epoch in range(self.args.num_epoch):
-            t0 = time.time()
-            for _, sample_batched in enumerate(self.data_loader):
-                data_real = torch.tensor(sample_batched, dtype=torch.float32)
-                batch_size = sample_batched.size(0)
-                # 1. Train Discriminator: maximize log(D(x)) + log(1 - D(G(z)))
-                for _ in range(5):
-                    pred_real = self.Discriminator(data_real)
-                    loss_real = - pred_real.mean()
-                    # Generate data
-                    z = torch.randn(batch_size, self.args.dim_noise)
-                    data_fake = self.Generator(z).detach()
-                    pred_fake = self.Discriminator(data_fake)
-                    loss_fake = pred_fake.mean()
-                    # Discriminator loss
-                    if self.args.model_name == 'WGAN':
-                        grad_penalty = self.gradient_penalty(data_real, data_fake, batch_size)
-                    else:
-                        grad_penalty = 0
-                    dis_loss = loss_real + loss_fake + grad_penalty
-                    dis_optimizer.zero_grad()
-                    dis_loss.backward()
-                    dis_optimizer.step()
-                # Train Generator: maximize log(D(G(z)))
-                pred_fake = self.Discriminator(data_fake)
-                gen_loss = - pred_fake.mean()
-                gen_optimizer.zero_grad()
-                gen_loss.backward()
-                gen_optimizer.step()
-                mse = criterion(data_fake, data_real)
-            t1 = time.time()
-            print('\033[1;31m[Epoch {:>4}]\033[0m  '
-                  '\033[1;31mD(x) = {:.5f}\033[0m  '
-                  '\033[1;32mD(G(z)) = {:.5f}\033[0m  '
-                  '\033[1;32mMSE = {:.5f}\033[0m  '
-                  'Time cost={:.2f}s'.format(epoch + 1,
-                                             -loss_real,
-                                             - gen_loss,
-                                             mse,
-                                             t1 - t0
-                                             )
-                  )
-            dis_losses.append(dis_loss.item())
-            gen_losses.append(- gen_loss.item())
-            fig, ax = plt.subplots()
-            ax.plot(data_real[0], label='real')
-            ax.plot(data_fake[0], ls='--', lw=0.5, label='fake')
-            ax.legend()
+            with self.profiler.epoch(epoch):
+                t0 = time.time()
+                for _, sample_batched in enumerate(self.profiler.iterate('data', self.data_loader)):
+                    data_real = sample_batched.float()
+                    loss_real, dis_loss, gen_loss, data_fake = self.train_batch(data_real, gen_optimizer, dis_optimizer)
+                    mse = criterion(data_fake, data_real)
+                t1 = time.time()
+                print('\033[1;31m[Epoch {:>4}]\033[0m  '
+                      '\033[1;31mD(x) = {:.5f}\033[0m  '
+                      '\033[1;32mD(G(z)) = {:.5f}\033[0m  '
+                      '\033[1;32mMSE = {:.5f}\033[0m  '
+                      'Time cost={:.2f}s'.format(epoch + 1,
+                                                 -loss_real,
+                                                 - gen_loss,
+                                                 mse,
+                                                 t1 - t0
+                                                 )
+                      )
+                dis_losses.append(dis_loss.item())
+                gen_losses.append(- gen_loss.item())
+                with self.profiler.phase('plot'):
+                    fig, ax = plt.subplots()
+                    ax.plot(data_real[0], label='real')
+                    ax.plot(data_fake[0], ls='--', lw=0.5, label='fake')
+                    ax.legend()
+        self.profiler.close()
+        if self.profiler.enabled:
+            with open('{}/learning history/{}.json'.format(save_path, self.file_name()), 'w') as f:
+                f.write(json.dumps({'Profile': self.profiler.summary()}, indent=2))
         plt.show()
         # # Save models
-        # path_gen = '{}/models/{}_Gen.model'.format(save_path, self.file_name())
-        # path_dis = '{}/models/{}_Dis.model'.format(save_path, self.file_name())
+        # path_gen = checkpoint_path(self.args, 'Gen')
+        # path_dis = checkpoint_path(self.args, 'Dis')
         # torch.save(self.Generator.state_dict(), path_gen)
         # torch.save(self.Discriminator.state_dict(), path_dis)
         # # Write learning history
@@ -179,7 +211,7 @@ class BaseExperiment:
         #     f.write(losses)
 
 
-def main():
+def get_parser():
     # Hyper-parameters
     parser = argparse.ArgumentParser()
     parser.add_argument('--dataset', default='W-1', type=str)
@@ -197,7 +229,18 @@ def main():
     parser.add_argument('--batch_size', default=16, type=int)
     parser.add_argument('--num_epoch', default=100, type=int)
     parser.add_argument('--learning_rate', default=1e-2, type=float)
-    args = parser.parse_args()
+    # Critic updates per Generator update, gradient penalty every gp_every of them
+    parser.add_argument('--n_critic', default=5, type=int)
+    parser.add_argument('--gp_every', default=4, type=int)
+    # Phase timers, histograms in the learning history and a Chrome trace under results/profiles
+    parser.add_argument('--profile', action='store_true')
+    # Epochs (1-based) traced call by call and under torch.profiler, implies --profile
+    parser.add_argument('--profile_epochs', default=[], type=int, nargs='*')
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
     exp = BaseExperiment(args)
     exp.train()
 
@@ -12,18 +12,22 @@
 
 
 import torch
-from torch.utils.data import DataLoader
 from torch import nn, optim, autograd
 import numpy as np
 import matplotlib.pyplot as plt
-import data_processing as dp
+from utils.dataset_cache import CachedDatasetReader
+from utils.batching import TensorBatches
+from utils.profiler import make_profiler
 import time
+import json
 import argparse
 from models.Generator import Generator
 from models.Discriminator import Discriminator
+from models.registry import file_name
 
 
 data_path = './data/data_processed'
+cache_path = './data/cache'
 save_path = './results'
 
 
@@ -36,18 +40,23 @@ class BaseExperiment:
         print('> Training arguments:')
         for arg in vars(args):
             print('>>> {}: {}'.format(arg, getattr(args, arg)))
-        white_noise = dp.DatasetReader(white_noise=self.args.dataset,
-                                       data_path=data_path,
-                                       data_source=args.data,
-                                       len_seg=self.args.len_seg
-                                       )
+        white_noise = CachedDatasetReader(white_noise=self.args.dataset,
+                                          data_path=data_path,
+                                          cache_path=cache_path,
+                                          data_source=args.data,
+                                          len_seg=self.args.len_seg
+                                          )
         dataset, _ = white_noise(args.net_name)
-        self.data_loader = DataLoader(dataset=dataset,
-                                      batch_size=args.batch_size,
-                                      shuffle=False,
-                                      )
+        self.data_loader = TensorBatches(dataset=dataset,
+                                         batch_size=args.batch_size,
+                                         shuffle=False,
+                                         unsqueeze=2
+                                         )
         self.Generator = Generator(args)  # Generator
         self.Discriminator = Discriminator(args)  # Discriminator
+        self.profiler = make_profiler(args.profile, args.profile_epochs,
+                                      trace_path='{}/profiles/{}.json'.format(save_path, self.file_name())
+                                      )
 
     def select_optimizer(self, model):
         if self.args.optimizer == 'Adam':
@@ -88,13 +97,7 @@ class BaseExperiment:
             nn.init.constant_(m.bias.data, 0)
 
     def file_name(self):
-        return '{}_{}_{}_{}_{}_{}'.format(self.args.model_name,
-                                          self.args.net_name,
-                                          self.args.len_seg,
-                                          self.args.optimizer,
-                                          self.args.learning_rate,
-                                          self.args.num_epoch
-                                          )
+        return file_name(self.args)
 
     def gradient_penalty(self, x_real, x_fake, batch_size, beta=0.3):
         x_real = x_real.detach()
@@ -124,59 +127,66 @@ class BaseExperiment:
         G_losses = []
         D_losses = []
         for epoch in range(self.args.num_epoch):
-            t0 = time.time()
-            for i, sample_batched in enumerate(self.data_loader):
-                # 1. Train Discriminator: maximize log(D(x)) + log(1 - D(G(z)))
-                self.Discriminator.zero_grad()
-                data_real = torch.tensor(sample_batched, dtype=torch.float32)
-                data_real = data_real.unsqueeze(2)
-                batch_size = sample_batched.size(0)
-                label = torch.full((batch_size, ), 1, dtype=torch.float32)
-                output = self.Discriminator(data_real)
-                errD_real = criterion(output, label)
-                errD_real.backward()
-                D_x = output.mean().item()
-                # Generate data
-                noise = torch.rand(batch_size, 100, 1, 1)
-                fake = self.Generator(noise).detach()
-                label.fill_(fake_label)
-                output = self.Discriminator(fake)
-                errD_fake = criterion(output, label)
-                errD_fake.backward()
-                D_G_z1 = output.mean().item()
-                optimizerD.zero_grad()
-                errD = errD_real + errD_fake
-                # Update D
-                optimizerD.step()
-                # Train Generator: maximize log(D(G(z)))
-                self.Generator.zero_grad()
-                label.fill_(real_label)
-                output = self.Discriminator(fake)
-                errG = criterion(output, label)
-                optimizerG.zero_grad()
-                errG.backward()
-                D_G_z2 = output.mean().item()
-                # Update G
-                optimizerG.step()
-                # mse = criterion(fake, data_real)
-                f = fake.squeeze(2)
-                r = data_real.squeeze(2)
-                mse = c(f, r)
-            # t1 = time.time()
-                if i % 50 == 0:
-                    print('[%d/%d][%d/%d]\tLoss_D: %.4f\tLoss_G: %.4f\tD(x): %.4f\tD(G(z)): %.4f / %.4f'
-                          % (epoch, self.args.num_epoch, i, len(self.data_loader),
-                             errD.item(), errG.item(), D_x, D_G_z1, D_G_z2))
-                    print(mse)
-                # Save Losses for plotting later
-                G_losses.append(errG.item())
-                D_losses.append(errD.item())
-                data_fake = f.numpy()
-                data_real = r.numpy()
-            fig, ax = plt.subplots()
-            ax.plot(data_fake[0][1], label='fake')
-            ax.plot(data_real[0][1], ls='--', lw=0.5, label='real')
-            ax.legend()
+            with self.profiler.epoch(epoch):
+                t0 = time.time()
+                for i, sample_batched in enumerate(self.profiler.iterate('data', self.data_loader)):
+                    # 1. Train Discriminator: maximize log(D(x)) + log(1 - D(G(z)))
+                    with self.profiler.phase('discriminator'):
+                        self.Discriminator.zero_grad()
+                        data_real = sample_batched.float()
+                        batch_size = sample_batched.size(0)
+                        label = torch.full((batch_size, ), 1, dtype=torch.float32)
+                        output = self.Discriminator(data_real)
+                        errD_real = criterion(output, label)
+                        errD_real.backward()
+                        D_x = output.mean().item()
+                        # Generate data
+                        noise = torch.rand(batch_size, 100, 1, 1)
+                        fake = self.Generator(noise).detach()
+                        label.fill_(fake_label)
+                        output = self.Discriminator(fake)
+                        errD_fake = criterion(output, label)
+                        errD_fake.backward()
+                        D_G_z1 = output.mean().item()
+                        optimizerD.zero_grad()
+                        errD = errD_real + errD_fake
+                        # Update D
+                        optimizerD.step()
+                    # Train Generator: maximize log(D(G(z)))
+                    with self.profiler.phase('generator'):
+                        self.Generator.zero_grad()
+                        label.fill_(real_label)
+                        output = self.Discriminator(fake)
+                        errG = criterion(output, label)
+                        optimizerG.zero_grad()
+                        errG.backward()
+                        D_G_z2 = output.mean().item()
+                        # Update G
+                        optimizerG.step()
+                    # mse = criterion(fake, data_real)
+                    f = fake.squeeze(2)
+                    r = data_real.squeeze(2)
+                    mse = c(f, r)
+                # t1 = time.time()
+                    if i % 50 == 0:
+                        print('[%d/%d][%d/%d]\tLoss_D: %.4f\tLoss_G: %.4f\tD(x): %.4f\tD(G(z)): %.4f / %.4f'
+                              % (epoch, self.args.num_epoch, i, len(self.data_loader),
+                                 errD.item(), errG.item(), D_x, D_G_z1, D_G_z2))
+                        print(mse)
+                    # Save Losses for plotting later
+                    G_losses.append(errG.item())
+                    D_losses.append(errD.item())
+                    data_fake = f.numpy()
+                    data_real = r.numpy()
+                with self.profiler.phase('plot'):
+                    fig, ax = plt.subplots()
+                    ax.plot(data_fake[0][1], label='fake')
+                    ax.plot(data_real[0][1], ls='--', lw=0.5, label='real')
+                    ax.legend()
+        self.profiler.close()
+        if self.profiler.enabled:
+            with open('{}/learning history/{}.json'.format(save_path, self.file_name()), 'w') as f:
+                f.write(json.dumps({'Profile': self.profiler.summary()}, indent=2))
         plt.show()
 
 
@@ -198,6 +208,10 @@ def main():
     parser.add_argument('--batch_size', default=1, type=int)
     parser.add_argument('--num_epoch', default=100, type=int)
     parser.add_argument('--learning_rate', default=0.0002, type=float)
+    # Phase timers, histograms in the learning history and a Chrome trace under results/profiles
+    parser.add_argument('--profile', action='store_true')
+    # Epochs (1-based) traced call by call and under torch.profiler, implies --profile
+    parser.add_argument('--profile_epochs', default=[], type=int, nargs='*')
     args = parser.parse_args()
     exp = BaseExperiment(args)
     exp.train()
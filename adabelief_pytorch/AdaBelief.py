@@ -4,6 +4,30 @@ from torch.optim.optimizer import Optimizer
 
 version_higher = ( torch.__version__ >= "1.5.0" )
 
+state_keys = ('exp_avg', 'exp_avg_var', 'max_exp_avg_var')
+
+def quantize_blockwise(tensor, block_size, unsigned=False):
+    """Block-wise absmax quantization of the flattened tensor to 8 bits with one
+    fp32 scale per block. Unsigned tensors are rounded up, so a small but non-zero
+    value never collapses to zero"""
+    flat = tensor.detach().reshape(-1).float()
+    pad = (-flat.numel()) % block_size
+    if pad:
+        flat = torch.nn.functional.pad(flat, (0, pad))
+    blocks = flat.view(-1, block_size)
+    levels = 255 if unsigned else 127
+    scale = blocks.abs().amax(dim=1, keepdim=True) / levels
+    blocks = blocks / scale.clamp(min=torch.finfo(torch.float32).tiny)
+    if unsigned:
+        quantized = blocks.ceil_().clamp_(0, levels).to(torch.uint8)
+    else:
+        quantized = blocks.round_().clamp_(-levels, levels).to(torch.int8)
+    return quantized.view(-1), scale.view(-1)
+
+def dequantize_blockwise(quantized, scale, like):
+    blocks = quantized.view(scale.numel(), -1).float() * scale.view(-1, 1)
+    return blocks.view(-1)[:like.numel()].view_as(like)
+
 class AdaBelief(Optimizer):
     r"""Implements AdaBelief algorithm. Modified from Adam in PyTorch
 
@@ -30,13 +54,24 @@ class AdaBelief(Optimizer):
             weight decay ratio decreases with learning rate (lr).
         rectify (boolean, optional): (default: False) If set as True, then perform the rectified
             update similar to RAdam
+        state_precision (string, optional): (default: 'fp32') Storage of the moment estimates
+            between steps. 'bf16' keeps them in bfloat16, 'int8' quantizes them block-wise to
+            8 bits with one fp32 scale per block_size values (the variances as uint8 of their
+            square root, rounded up). They are dequantized to fp32 inside step, state dicts
+            saved at any precision load into an optimizer of any other precision
+        block_size (int, optional): (default: 256) values sharing a scale with 'int8'
+        foreach (boolean, optional): (default: None) If set as True, then update all parameters
+            of a group together with the multi-tensor torch._foreach_* kernels instead of a
+            Python loop over the parameters. None uses them for groups that live on the GPU,
+            on the CPU the kernels still loop over the tensors and the step is memory bound
 
     reference: AdaBelief Optimizer, adapting stepsizes by the belief in observed gradients
                NeurIPS 2020 Spotlight
     """
 
     def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8,
-                 weight_decay=0, amsgrad=False, weight_decouple = False, fixed_decay=False, rectify = False ):
+                 weight_decay=0, amsgrad=False, weight_decouple = False, fixed_decay=False, rectify = False,
+                 state_precision='fp32', block_size=256, foreach=None ):
         if not 0.0 <= lr:
             raise ValueError("Invalid learning rate: {}".format(lr))
         if not 0.0 <= eps:
@@ -45,6 +80,8 @@ class AdaBelief(Optimizer):
             raise ValueError("Invalid beta parameter at index 0: {}".format(betas[0]))
         if not 0.0 <= betas[1] < 1.0:
             raise ValueError("Invalid beta parameter at index 1: {}".format(betas[1]))
+        if state_precision not in ('fp32', 'bf16', 'int8'):
+            raise ValueError("Invalid state precision: {}".format(state_precision))
         defaults = dict(lr=lr, betas=betas, eps=eps,
                         weight_decay=weight_decay, amsgrad=amsgrad)
         super(AdaBelief, self).__init__(params, defaults)
@@ -52,6 +89,11 @@ class AdaBelief(Optimizer):
         self.weight_decouple = weight_decouple
         self.rectify = rectify
         self.fixed_decay = fixed_decay
+        self.state_precision = state_precision
+        self.block_size = block_size
+        if not hasattr(torch, '_foreach_maximum_'):
+            foreach = False
+        self.foreach = foreach
         if self.weight_decouple:
             print('Weight decoupling enabled in AdaBelief')
             if self.fixed_decay:
@@ -60,6 +102,8 @@ class AdaBelief(Optimizer):
             print('Rectification enabled in AdaBelief')
         if amsgrad:
             print('AMS enabled in AdaBelief')
+        if state_precision != 'fp32':
+            print('{} state enabled in AdaBelief'.format(state_precision))
     def __setstate__(self, state):
         super(AdaBelief, self).__setstate__(state)
         for group in self.param_groups:
@@ -85,6 +129,77 @@ class AdaBelief(Optimizer):
                     state['max_exp_avg_var'] = torch.zeros_like(p.data,
                                     memory_format=torch.preserve_format) if version_higher else torch.zeros_like(p.data)
 
+    def load_state_dict(self, state_dict):
+        super(AdaBelief, self).load_state_dict(state_dict)
+        # Optimizer.load_state_dict casts all state to the parameter dtype, which would
+        # turn 8-bit codes into floats: take the moments from state_dict as they were
+        # saved, then store them back at this optimizer's precision
+        params = [p for group in self.param_groups for p in group['params']]
+        saved_params = [i for group in state_dict['param_groups'] for i in group['params']]
+        for p, i in zip(params, saved_params):
+            if i not in state_dict['state']:
+                continue
+            state, saved = self.state[p], state_dict['state'][i]
+            for key in state_keys:
+                if key in saved:
+                    state[key] = saved[key].to(p.device, copy=True)
+                    if key + '_scale' in saved:
+                        state[key + '_scale'] = saved[key + '_scale'].to(p.device, copy=True)
+                    self._store(state, key, self._load(state, key, p))
+
+    def _load(self, state, key, p):
+        """fp32 view of a moment estimate, whatever precision it was stored at"""
+        value = state[key]
+        if value.dtype == torch.uint8:
+            return dequantize_blockwise(value, state[key + '_scale'], p.data).pow_(2)
+        if value.dtype == torch.int8:
+            return dequantize_blockwise(value, state[key + '_scale'], p.data)
+        if value.dtype != p.dtype:
+            return value.to(p.dtype)
+        return value
+
+    def _store(self, state, key, value):
+        if self.state_precision == 'fp32':
+            state[key] = value
+            state.pop(key + '_scale', None)
+        elif self.state_precision == 'bf16':
+            state[key] = value.to(torch.bfloat16)
+            state.pop(key + '_scale', None)
+        elif key == 'exp_avg':
+            state[key], state[key + '_scale'] = quantize_blockwise(value, self.block_size)
+        else:
+            state[key], state[key + '_scale'] = quantize_blockwise(value.sqrt(), self.block_size, unsigned=True)
+
+    def _init_state(self, p, group):
+        state = self.state[p]
+        beta1, beta2 = group['betas']
+        state['rho_inf'] = 2.0 / (1.0 - beta2) - 1.0
+        state['step'] = 0
+        # Exponential moving average of gradient values
+        state['exp_avg'] = torch.zeros_like(p.data,
+                        memory_format=torch.preserve_format) if version_higher else torch.zeros_like(p.data)
+        # Exponential moving average of squared gradient values
+        state['exp_avg_var'] = torch.zeros_like(p.data,
+                        memory_format=torch.preserve_format) if version_higher else torch.zeros_like(p.data)
+        if group['amsgrad']:
+            # Maintains max of all exp. moving avg. of sq. grad. values
+            state['max_exp_avg_var'] = torch.zeros_like(p.data,
+                        memory_format=torch.preserve_format) if version_higher else torch.zeros_like(p.data)
+
+    def _rectified_step_size(self, state, group, bias_correction1):
+        """Step size of the rectified update, None when the SGD style update applies"""
+        beta1, beta2 = group['betas']
+        # calculate rho_t
+        state['rho_t'] = state['rho_inf'] - 2 * state['step'] * beta2 ** state['step'] / (
+                1.0 - beta2 ** state['step'])
+
+        if state['rho_t'] > 4: # perform Adam style update if variance is small
+            rho_inf, rho_t = state['rho_inf'], state['rho_t']
+            rt = (rho_t - 4.0) * (rho_t - 2.0) * rho_inf / (rho_inf - 4.0) / (rho_inf - 2.0) / rho_t
+            rt = math.sqrt(rt)
+            return rt * group['lr'] / bias_correction1
+        return None
+
     def step(self, closure=None):
         """Performs a single optimization step.
 
@@ -97,86 +212,161 @@ class AdaBelief(Optimizer):
             loss = closure()
 
         for group in self.param_groups:
-            for p in group['params']:
-                if p.grad is None:
-                    continue
-                grad = p.grad.data
-                if grad.is_sparse:
-                    raise RuntimeError('AdaBelief does not support sparse gradients, please consider SparseAdam instead')
-                amsgrad = group['amsgrad']
+            foreach = self.foreach
+            if foreach is None:
+                foreach = all(p.is_cuda for p in group['params'])
+            if foreach:
+                self._foreach_step(group)
+            else:
+                self._single_step(group)
 
-                state = self.state[p]
-               
-                beta1, beta2 = group['betas']
+        return loss
 
-                # State initialization
-                if len(state) == 0:
-                    state['rho_inf'] = 2.0 / (1.0 - beta2) - 1.0
-                    state['step'] = 0
-                    # Exponential moving average of gradient values
-                    state['exp_avg'] = torch.zeros_like(p.data,
-                                    memory_format=torch.preserve_format) if version_higher else torch.zeros_like(p.data)
-                    # Exponential moving average of squared gradient values
-                    state['exp_avg_var'] = torch.zeros_like(p.data,
-                                    memory_format=torch.preserve_format) if version_higher else torch.zeros_like(p.data)
-                    if amsgrad:
-                        # Maintains max of all exp. moving avg. of sq. grad. values
-                        state['max_exp_avg_var'] = torch.zeros_like(p.data,
-                                    memory_format=torch.preserve_format) if version_higher else torch.zeros_like(p.data)
+    def _single_step(self, group):
+        for p in group['params']:
+            if p.grad is None:
+                continue
+            grad = p.grad.data
+            if grad.is_sparse:
+                raise RuntimeError('AdaBelief does not support sparse gradients, please consider SparseAdam instead')
+            amsgrad = group['amsgrad']
 
-                # get current state variable
-                exp_avg, exp_avg_var = state['exp_avg'], state['exp_avg_var']
+            state = self.state[p]
 
-                state['step'] += 1
-                bias_correction1 = 1 - beta1 ** state['step']
-                bias_correction2 = 1 - beta2 ** state['step']
+            beta1, beta2 = group['betas']
 
-                # perform weight decay, check if decoupled weight decay
-                if self.weight_decouple:
-                    if not self.fixed_decay:
-                        p.data.mul_(1.0 - group['lr'] * group['weight_decay'])
-                    else:
-                        p.data.mul_(1.0 - group['weight_decay'])
-                else:
-                    if group['weight_decay'] != 0:
-                        grad.add_(group['weight_decay'], p.data)
+            # State initialization
+            if len(state) == 0:
+                self._init_state(p, group)
 
-                # Update first and second moment running average
-                exp_avg.mul_(beta1).add_(1 - beta1, grad)
-                grad_residual = grad - exp_avg
-                exp_avg_var.mul_(beta2).addcmul_(1 - beta2, grad_residual, grad_residual)
+            # get current state variable
+            exp_avg, exp_avg_var = self._load(state, 'exp_avg', p), self._load(state, 'exp_avg_var', p)
 
-                if amsgrad:
-                    max_exp_avg_var = state['max_exp_avg_var']
-                    # Maintains the maximum of all 2nd moment running avg. till now
-                    torch.max(max_exp_avg_var, exp_avg_var, out=max_exp_avg_var)
+            state['step'] += 1
+            bias_correction1 = 1 - beta1 ** state['step']
+            bias_correction2 = 1 - beta2 ** state['step']
 
-                    # Use the max. for normalizing running avg. of gradient
-                    denom = (max_exp_avg_var.add_(group['eps']).sqrt() / math.sqrt(bias_correction2)).add_(group['eps'])
+            # perform weight decay, check if decoupled weight decay
+            if self.weight_decouple:
+                if not self.fixed_decay:
+                    p.data.mul_(1.0 - group['lr'] * group['weight_decay'])
                 else:
-                    denom = (exp_avg_var.add_(group['eps']).sqrt() / math.sqrt(bias_correction2)).add_(group['eps'])
+                    p.data.mul_(1.0 - group['weight_decay'])
+            else:
+                if group['weight_decay'] != 0:
+                    grad.add_(p.data, alpha=group['weight_decay'])
 
-                if not self.rectify:
-                    # Default update
-                    step_size = group['lr'] / bias_correction1
-                    p.data.addcdiv_(-step_size, exp_avg, denom)
+            # Update first and second moment running average
+            exp_avg.mul_(beta1).add_(grad, alpha=1 - beta1)
+            grad_residual = grad - exp_avg
+            exp_avg_var.mul_(beta2).addcmul_(grad_residual, grad_residual, value=1 - beta2)
 
-                else:# Rectified update
-                    # calculate rho_t
-                    state['rho_t'] = state['rho_inf'] - 2 * state['step'] * beta2 ** state['step'] / (
-                            1.0 - beta2 ** state['step'])
+            if amsgrad:
+                max_exp_avg_var = self._load(state, 'max_exp_avg_var', p)
+                # Maintains the maximum of all 2nd moment running avg. till now
+                torch.max(max_exp_avg_var, exp_avg_var, out=max_exp_avg_var)
 
-                    if state['rho_t'] > 4: # perform Adam style update if variance is small
-                        rho_inf, rho_t = state['rho_inf'], state['rho_t']
-                        rt = (rho_t - 4.0) * (rho_t - 2.0) * rho_inf / (rho_inf - 4.0) / (rho_inf - 2.0) / rho_t
-                        rt = math.sqrt(rt)
+                # Use the max. for normalizing running avg. of gradient
+                denom = (max_exp_avg_var.add_(group['eps']).sqrt() / math.sqrt(bias_correction2)).add_(group['eps'])
+                self._store(state, 'max_exp_avg_var', max_exp_avg_var)
+            else:
+                denom = (exp_avg_var.add_(group['eps']).sqrt() / math.sqrt(bias_correction2)).add_(group['eps'])
+            self._store(state, 'exp_avg', exp_avg)
+            self._store(state, 'exp_avg_var', exp_avg_var)
 
-                        step_size = rt * group['lr'] / bias_correction1
+            if not self.rectify:
+                # Default update
+                step_size = group['lr'] / bias_correction1
+                p.data.addcdiv_(exp_avg, denom, value=-step_size)
 
-                        p.data.addcdiv_(-step_size, exp_avg, denom)
+            else:# Rectified update
+                step_size = self._rectified_step_size(state, group, bias_correction1)
+                if step_size is not None:
+                    p.data.addcdiv_(exp_avg, denom, value=-step_size)
 
-                    else: # perform SGD style update
-                        p.data.add_( -group['lr'], exp_avg)
+                else: # perform SGD style update
+                    p.data.add_(exp_avg, alpha=-group['lr'])
 
-        return loss
+    def _foreach_step(self, group):
+        """Same update as _single_step, with the parameters of a group that share
+        step count, device and dtype updated together by the torch._foreach_* ops"""
+        amsgrad = group['amsgrad']
+        beta1, beta2 = group['betas']
+
+        # Parameters only share the scalar bias corrections if they share the step
+        # count, which differs only for parameters that missed gradients before
+        buckets = {}
+        for p in group['params']:
+            if p.grad is None:
+                continue
+            if p.grad.is_sparse:
+                raise RuntimeError('AdaBelief does not support sparse gradients, please consider SparseAdam instead')
+            state = self.state[p]
+            if len(state) == 0:
+                self._init_state(p, group)
+            state['step'] += 1
+            key = (state['step'], p.device, p.dtype)
+            buckets.setdefault(key, []).append(p)
+
+        for (step, _, _), params in buckets.items():
+            states = [self.state[p] for p in params]
+            data = [p.data for p in params]
+            grads = [p.grad.data for p in params]
+            exp_avgs = [self._load(state, 'exp_avg', p) for state, p in zip(states, params)]
+            exp_avg_vars = [self._load(state, 'exp_avg_var', p) for state, p in zip(states, params)]
+
+            bias_correction1 = 1 - beta1 ** step
+            bias_correction2 = 1 - beta2 ** step
+
+            # perform weight decay, check if decoupled weight decay
+            if self.weight_decouple:
+                if not self.fixed_decay:
+                    torch._foreach_mul_(data, 1.0 - group['lr'] * group['weight_decay'])
+                else:
+                    torch._foreach_mul_(data, 1.0 - group['weight_decay'])
+            else:
+                if group['weight_decay'] != 0:
+                    torch._foreach_add_(grads, data, alpha=group['weight_decay'])
+
+            # Update first and second moment running average
+            torch._foreach_mul_(exp_avgs, beta1)
+            torch._foreach_add_(exp_avgs, grads, alpha=1 - beta1)
+            grad_residuals = torch._foreach_sub(grads, exp_avgs)
+            torch._foreach_mul_(exp_avg_vars, beta2)
+            torch._foreach_addcmul_(exp_avg_vars, grad_residuals, grad_residuals, value=1 - beta2)
+            del grad_residuals
+
+            if amsgrad:
+                max_exp_avg_vars = [self._load(state, 'max_exp_avg_var', p) for state, p in zip(states, params)]
+                # Maintains the maximum of all 2nd moment running avg. till now
+                torch._foreach_maximum_(max_exp_avg_vars, exp_avg_vars)
+                # Use the max. for normalizing running avg. of gradient
+                denom_vars = max_exp_avg_vars
+            else:
+                denom_vars = exp_avg_vars
+
+            # eps is added to the (max.) variance in place, as in _single_step
+            torch._foreach_add_(denom_vars, group['eps'])
+            denom = torch._foreach_sqrt(denom_vars)
+            torch._foreach_div_(denom, math.sqrt(bias_correction2))
+            torch._foreach_add_(denom, group['eps'])
+            for i, state in enumerate(states):
+                self._store(state, 'exp_avg', exp_avgs[i])
+                self._store(state, 'exp_avg_var', exp_avg_vars[i])
+                if amsgrad:
+                    self._store(state, 'max_exp_avg_var', max_exp_avg_vars[i])
+
+            if not self.rectify:
+                # Default update
+                step_size = group['lr'] / bias_correction1
+                torch._foreach_addcdiv_(data, exp_avgs, denom, value=-step_size)
+
+            else:# Rectified update
+                step_size = None
+                for state in states:
+                    step_size = self._rectified_step_size(state, group, bias_correction1)
+                if step_size is not None:
+                    torch._foreach_addcdiv_(data, exp_avgs, denom, value=-step_size)
 
+                else: # perform SGD style update
+                    torch._foreach_add_(data, exp_avgs, alpha=-group['lr'])
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 22/10/26 9:30 AM
+@description: Per-parameter vs foreach AdaBelief step and low-precision state on the AutoEncoder parameters
+@version: 1.0
+"""
+
+
+import copy
+import time
+import argparse
+import torch
+from adabelief_pytorch import AdaBelief
+from models.AutoEncoder import AutoEncoder
+
+
+variants = {'default': {},
+            'weight_decay': {'weight_decay': 1e-4},
+            'weight_decouple': {'weight_decay': 1e-2, 'weight_decouple': True},
+            'fixed_decay': {'weight_decay': 1e-4, 'weight_decouple': True, 'fixed_decay': True},
+            'amsgrad': {'amsgrad': True},
+            'rectify': {'rectify': True}
+            }
+
+
+def fill_grads(model, generator):
+    for p in model.parameters():
+        p.grad = torch.randn(p.shape, generator=generator)
+
+
+def state_bytes(optimizer):
+    return sum(v.numel() * v.element_size() for state in optimizer.state.values()
+               for v in state.values() if torch.is_tensor(v))
+
+
+def run(model, foreach, kwargs, num_step, seed=0, state_precision='fp32'):
+    """
+    :return: seconds per step, the parameters after num_step steps on the
+             same sequence of random gradients and the optimizer
+    """
+    optimizer = AdaBelief(model.parameters(), lr=1e-3, foreach=foreach, state_precision=state_precision, **kwargs)
+    generator = torch.Generator().manual_seed(seed)
+    elapsed = 0.
+    for _ in range(num_step):
+        fill_grads(model, generator)
+        t0 = time.time()
+        optimizer.step()
+        elapsed += time.time() - t0
+    return elapsed / num_step, [p.detach().clone() for p in model.parameters()], optimizer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--net_name', default='MLP', type=str)
+    parser.add_argument('--num_step', default=200, type=int)
+    parser.add_argument('--dim_input', default=384, type=int)
+    parser.add_argument('--dim_feature', default=20, type=int)
+    parser.add_argument('--num_feature_map', default=128, type=int)
+    parser.add_argument('--num_hidden_map', default=256, type=int)
+    args = parser.parse_args()
+    args.model_name = 'AE'
+    torch.manual_seed(0)
+    model = AutoEncoder(args)
+    print('{} parameter tensors'.format(len(list(model.parameters()))))
+    for name, kwargs in variants.items():
+        single_time, single, _ = run(copy.deepcopy(model), False, kwargs, args.num_step)
+        foreach_time, foreach, _ = run(copy.deepcopy(model), True, kwargs, args.num_step)
+        diff = max((a - b).abs().max().item() for a, b in zip(single, foreach))
+        print('{:>15}: {:4f}ms per-parameter, {:4f}ms foreach, {:2f}x, max abs diff {:.2e}'.format(
+            name, single_time * 1e3, foreach_time * 1e3, single_time / foreach_time, diff))
+    # Drift of the parameters relative to their fp32 update, next to the state memory
+    for name in ('default', 'amsgrad'):
+        _, reference, optimizer = run(copy.deepcopy(model), False, variants[name], args.num_step)
+        for state_precision in ('fp32', 'bf16', 'int8'):
+            step_time, params, optimizer = run(copy.deepcopy(model), False, variants[name], args.num_step,
+                                               state_precision=state_precision)
+            drift = max(((a - b).norm() / (a - p0).norm()).item()
+                        for a, b, p0 in zip(reference, params, model.parameters()))
+            print('{:>15}: {:>4} state {:8.3f}MiB, {:4f}ms per step, max relative drift {:.2e}'.format(
+                name, state_precision, state_bytes(optimizer) / 2 ** 20, step_time * 1e3, drift))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 20/10/26 10:40 AM
+@description: Epoch time of DataLoader vs TensorBatches on the MLP AutoEncoder
+@version: 1.0
+"""
+
+
+import time
+import argparse
+import torch
+from torch import nn, optim
+from torch.utils.data import DataLoader
+from models.AutoEncoder import AutoEncoder
+from utils.batching import TensorBatches
+
+
+def loader_time(loader, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        for _ in loader:
+            pass
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def epoch_time(model, loader, net_name, repeat):
+    optimizer = optim.Adam(model.parameters(), lr=1e-4)
+    criterion = nn.MSELoss()
+    times = []
+    for _ in range(repeat):
+        t0 = time.time()
+        for x in loader:
+            if net_name == 'Conv2D' and x.dim() == 3: x = x.unsqueeze(2)
+            x_hat, z, z_hat = model(x)
+            loss = 0.5 * criterion(x_hat, x) + 0.5 * criterion(z_hat, z)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+        times.append(time.time() - t0)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--net_name', default='MLP', type=str)
+    parser.add_argument('--num_samples', default=5000, type=int)
+    parser.add_argument('--batch_size', default=16, type=int)
+    parser.add_argument('--shuffle', action='store_true')
+    parser.add_argument('--repeat', default=3, type=int)
+    parser.add_argument('--dim_input', default=384, type=int)
+    parser.add_argument('--dim_feature', default=20, type=int)
+    parser.add_argument('--num_feature_map', default=128, type=int)
+    parser.add_argument('--num_hidden_map', default=256, type=int)
+    args = parser.parse_args()
+    args.model_name = 'AE'
+    torch.manual_seed(0)
+    if args.net_name == 'MLP':
+        dataset = torch.rand(args.num_samples, args.dim_input)
+    else:
+        dataset = torch.rand(args.num_samples, 3, args.dim_input // 3)
+    model = AutoEncoder(args)
+    loaders = {'DataLoader': DataLoader(dataset=dataset, batch_size=args.batch_size, shuffle=args.shuffle),
+               'TensorBatches': TensorBatches(dataset=dataset, batch_size=args.batch_size, shuffle=args.shuffle,
+                                              unsqueeze=2 if args.net_name == 'Conv2D' else None)
+               }
+    epoch_time(model, loaders['TensorBatches'], args.net_name, 1)  # Warm-up
+    times, data_times = {}, {}
+    for name, loader in loaders.items():
+        data_times[name] = loader_time(loader, args.repeat)
+        times[name] = epoch_time(model, loader, args.net_name, args.repeat)
+        print('{:>14}: {:4f}s per epoch ({:4f}s batching)'.format(name, times[name], data_times[name]))
+    print('Speed-up: {:2f}x per epoch, {:2f}x batching'.format(times['DataLoader'] / times['TensorBatches'],
+                                                               data_times['DataLoader'] / data_times['TensorBatches']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 23/10/26 11:30 AM
+@description: Train steps per second of the AutoEncoders, eager vs torch.compile
+@version: 1.0
+"""
+
+
+import time
+import argparse
+import torch
+from torch import nn, optim
+from adabelief_pytorch import AdaBelief
+from models.AutoEncoder import AutoEncoder
+from utils.compile import CompiledStep, eager
+
+
+def make_step(model, optimizer, beta=0.5):
+    criterion = nn.MSELoss()
+
+    def step(x):
+        x_hat, z, z_hat = model(x)
+        loss = beta * criterion(x_hat, x) + (1 - beta) * criterion(z_hat, z)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        return loss.detach()
+    return step
+
+
+def steps_per_sec(args, compile):
+    """
+    :return: first call time (compilation) and steps per second afterwards
+    """
+    torch.manual_seed(0)
+    model = AutoEncoder(args)
+    if args.optimizer == 'AdaBelief':
+        optimizer = AdaBelief(model.parameters(), lr=1e-4, betas=(0.5, 0.999))
+        if compile: optimizer.step = eager(optimizer.step)
+    else:
+        optimizer = optim.Adam(model.parameters(), lr=1e-4, betas=(0.5, 0.999))
+    step = CompiledStep(make_step(model, optimizer), compile=compile)
+    if args.net_name == 'MLP':
+        x = torch.rand(args.batch_size, args.dim_input)
+    else:
+        x = torch.rand(args.batch_size, 3, 1, args.dim_input // 3)
+    t0 = time.time()
+    step(x)
+    first = time.time() - t0
+    for _ in range(args.num_warmup):
+        step(x)
+    t0 = time.time()
+    for _ in range(args.num_step):
+        step(x)
+    return first, args.num_step / (time.time() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--net_names', default=['MLP', 'Conv2D'], nargs='+', type=str)
+    parser.add_argument('--optimizer', default='Adam', type=str)
+    parser.add_argument('--batch_size', default=16, type=int)
+    parser.add_argument('--num_step', default=500, type=int)
+    parser.add_argument('--num_warmup', default=20, type=int)
+    parser.add_argument('--dim_input', default=384, type=int)
+    parser.add_argument('--dim_feature', default=20, type=int)
+    parser.add_argument('--num_feature_map', default=128, type=int)
+    parser.add_argument('--num_hidden_map', default=256, type=int)
+    args = parser.parse_args()
+    args.model_name = 'AE'
+    for net_name in args.net_names:
+        args.net_name = net_name
+        _, eager_rate = steps_per_sec(args, False)
+        first, compiled_rate = steps_per_sec(args, True)
+        print('{:>6}: {:8.1f} steps/s eager, {:8.1f} steps/s compiled ({:2f}x), first step {:2f}s'.format(
+            net_name, eager_rate, compiled_rate, compiled_rate / eager_rate, first))
+
+
+if __name__ == '__main__':
+    main()
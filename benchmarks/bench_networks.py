@@ -0,0 +1,278 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 28/10/26 9:45 AM
+@description: Throughput and peak memory of the AutoEncoder and GAN networks on synthetic spectra, with baselines
+@version: 1.0
+"""
+
+
+import os
+import sys
+import time
+import json
+import platform
+import argparse
+import numpy as np
+import torch
+from torch import nn, optim
+from layers.AE import AutoEncoder, AutoEncoderConv
+from layers.MLP import MLP_G, MLP_D
+from layers.Conv2D import Conv2D_G, Conv2D_D, nz
+
+
+metrics = ('Forward', 'Backward', 'Train step')
+
+
+def synthetic_spectra(num_samples, num_channels=3, num_bins=128, num_modes=4, seed=0):
+    """
+    FFT-magnitude-like segments: a few damped resonance peaks shared by the
+    channels with per-channel mode shapes, a noise floor, scaled to [0, 1]
+    per segment as the processed datasets are
+    :return: [num_samples, num_channels, num_bins] float32
+    """
+    rng = np.random.default_rng(seed)
+    f = np.arange(num_bins)[None, None, :]
+    peaks = np.sort(rng.uniform(5, num_bins - 5, size=(num_samples, num_modes)), axis=1)
+    peaks = peaks + rng.normal(0, 0.5, size=peaks.shape)
+    widths = rng.uniform(0.5, 3, size=(num_samples, num_modes))
+    shapes = rng.uniform(0.1, 1, size=(num_samples, num_channels, num_modes))
+    x = np.zeros((num_samples, num_channels, num_bins))
+    for m in range(num_modes):
+        lorentzian = 1 / (1 + ((f - peaks[:, None, m: m + 1]) / widths[:, None, m: m + 1]) ** 2)
+        x += shapes[:, :, m: m + 1] * lorentzian
+    x += np.abs(rng.normal(0, 0.02, size=x.shape))
+    x -= x.min(axis=2, keepdims=True)
+    x /= x.max(axis=2, keepdims=True)
+    return x.astype(np.float32)
+
+
+def make_cases(args):
+    """
+    :return: {name: (model, input builder batch_size -> tensor, loss)}
+    """
+    spectra = torch.from_numpy(synthetic_spectra(max(args.batch_sizes), num_bins=args.dim_input // 3))
+    ae_args = argparse.Namespace(model_name='AE', dim_input=args.dim_input, dim_feature=args.dim_feature,
+                                 num_feature_map=args.num_feature_map, num_hidden_map=None)
+    criterion = nn.MSELoss()
+
+    def ae_loss(x, outputs):
+        x_hat, z, z_hat = outputs
+        return args.beta * criterion(x_hat, x) + (1 - args.beta) * criterion(z_hat, z)
+
+    def mean_loss(x, outputs):
+        return outputs.mean()
+
+    cases = {'AE': (lambda: AutoEncoder(ae_args),
+                    lambda b: spectra[:b].reshape(b, -1),
+                    ae_loss)}
+    for num_hidden_map in args.num_hidden_maps:
+        conv_args = argparse.Namespace(**vars(ae_args))
+        conv_args.num_hidden_map = num_hidden_map
+        cases['AutoEncoderConv-{}'.format(num_hidden_map)] = (lambda a=conv_args: AutoEncoderConv(a),
+                                                             lambda b: spectra[:b].unsqueeze(2),
+                                                             ae_loss)
+    cases['MLP_G'] = (lambda: MLP_G(args.dim_noise, args.dim_hidden, args.dim_input),
+                      lambda b: torch.randn(b, args.dim_noise),
+                      mean_loss)
+    cases['MLP_D'] = (lambda: MLP_D(args.dim_input, args.dim_hidden),
+                      lambda b: spectra[:b].reshape(b, -1),
+                      mean_loss)
+    cases['Conv2D_G'] = (lambda: Conv2D_G(),
+                         lambda b: torch.randn(b, nz, 1, 1),
+                         mean_loss)
+    cases['Conv2D_D'] = (lambda: Conv2D_D(),
+                         lambda b: spectra[:b].unsqueeze(2),
+                         mean_loss)
+    if args.networks:
+        cases = {name: case for name, case in cases.items() if name in args.networks}
+    return cases
+
+
+def best_time(fn, num_step, repeat):
+    """
+    :return: the fastest of repeat runs of num_step calls, per call
+    """
+    fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(num_step):
+            fn()
+        times.append((time.perf_counter() - t0) / num_step)
+    return min(times)
+
+
+def peak_memory(model, x, loss_fn, optimizer, device):
+    """
+    Bytes held at the peak of a train step. On CUDA the allocator peak, on
+    CPU parameters, gradients, optimizer state and the tensors autograd
+    saves for backward, which is where the peak of a step is
+    """
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        loss_fn(x, model(x)).backward()
+        optimizer.step()
+        torch.cuda.synchronize()
+        return torch.cuda.max_memory_allocated(), 'cuda'
+    saved = {}
+
+    def pack(tensor):
+        saved[(tensor.untyped_storage().data_ptr(), tensor.dtype)] = tensor.untyped_storage().nbytes()
+        return tensor
+
+    optimizer.zero_grad()
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        loss = loss_fn(x, model(x))
+    loss.backward()
+    optimizer.step()
+    params = {p.untyped_storage().data_ptr() for p in model.parameters()}
+    activations = sum(nbytes for (ptr, _), nbytes in saved.items() if ptr not in params)
+    weights = sum(p.numel() * p.element_size() * 2 for p in model.parameters())
+    state = sum(t.numel() * t.element_size() for s in optimizer.state.values()
+                for t in s.values() if torch.is_tensor(t))
+    return weights + state + activations, 'autograd'
+
+
+def measure(build, inputs, loss_fn, batch_size, args, device):
+    torch.manual_seed(0)
+    model = build().to(device)
+    optimizer = optim.Adam(model.parameters(), lr=1e-4, betas=(0.5, 0.999))
+    x = inputs(batch_size).to(device)
+    sync = torch.cuda.synchronize if device.type == 'cuda' else (lambda: None)
+
+    def forward():
+        with torch.no_grad():
+            model(x)
+        sync()
+
+    def backward():
+        model.zero_grad(set_to_none=True)
+        loss_fn(x, model(x)).backward()
+        sync()
+
+    def train_step():
+        optimizer.zero_grad()
+        loss_fn(x, model(x)).backward()
+        optimizer.step()
+        sync()
+
+    model.eval()
+    forward_time = best_time(forward, args.num_step, args.repeat)
+    model.train()
+    backward_time = best_time(backward, args.num_step, args.repeat)
+    step_time = best_time(train_step, args.num_step, args.repeat)
+    memory, source = peak_memory(model, x, loss_fn, optimizer, device)
+    return {'Forward': batch_size / forward_time,
+            'Backward': batch_size / backward_time,
+            'Train step': batch_size / step_time,
+            'Peak memory': memory / 2 ** 20,
+            'Memory source': source
+            }
+
+
+def key(record):
+    return '{}/b{}/t{}'.format(record['Network'], record['Batch size'], record['Threads'])
+
+
+def compare(baseline, results, tolerance):
+    """
+    Regressions of results against a baseline from an earlier run: a
+    throughput more than tolerance below, or a peak memory more than
+    tolerance above, the baseline's on the same network, batch size and
+    thread count
+    """
+    reference = {key(record): record for record in baseline['Results']}
+    regressions = []
+    for record in results:
+        previous = reference.get(key(record))
+        if previous is None:
+            continue
+        for metric in metrics:
+            if record[metric] < previous[metric] * (1 - tolerance):
+                regressions.append((key(record), metric, previous[metric], record[metric]))
+        if record['Peak memory'] > previous['Peak memory'] * (1 + tolerance):
+            regressions.append((key(record), 'Peak memory', previous['Peak memory'], record['Peak memory']))
+    return regressions
+
+
+def environment(device):
+    return {'Torch': torch.__version__,
+            'Python': platform.python_version(),
+            'Machine': platform.machine(),
+            'Processor': platform.processor(),
+            'CPU count': os.cpu_count(),
+            'Device': torch.cuda.get_device_name(device) if device.type == 'cuda' else 'cpu'
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # Subset of AE, AutoEncoderConv-{num_hidden_map}, MLP_G, MLP_D, Conv2D_G, Conv2D_D, all by default
+    parser.add_argument('--networks', default=[], nargs='*', type=str)
+    parser.add_argument('--num_hidden_maps', default=[32, 64, 128, 256], nargs='+', type=int)
+    parser.add_argument('--batch_sizes', default=[16, 64, 256], nargs='+', type=int)
+    # torch.set_num_threads values, 0 stands for the default thread count
+    parser.add_argument('--threads', default=[1, 0], nargs='+', type=int)
+    parser.add_argument('--num_step', default=20, type=int)
+    parser.add_argument('--repeat', default=3, type=int)
+    parser.add_argument('--device', default='cpu', type=str)
+    # Results written here, pass an earlier one as --baseline to flag regressions
+    parser.add_argument('--output', default='./results/benchmarks/networks.json', type=str)
+    parser.add_argument('--baseline', default=None, type=str)
+    # Relative slowdown or memory growth reported as a regression
+    parser.add_argument('--tolerance', default=0.1, type=float)
+    parser.add_argument('--dim_input', default=384, type=int)
+    parser.add_argument('--dim_feature', default=20, type=int)
+    parser.add_argument('--num_feature_map', default=128, type=int)
+    parser.add_argument('--dim_noise', default=50, type=int)
+    parser.add_argument('--dim_hidden', default=1000, type=int)
+    parser.add_argument('--beta', default=0.5, type=float)
+    args = parser.parse_args()
+    device = torch.device(args.device)
+    default_threads = torch.get_num_threads()
+    results = []
+    for threads in sorted({threads or default_threads for threads in args.threads}):
+        torch.set_num_threads(threads)
+        for name, (build, inputs, loss_fn) in make_cases(args).items():
+            for batch_size in args.batch_sizes:
+                record = {'Network': name, 'Batch size': batch_size, 'Threads': torch.get_num_threads()}
+                record.update(measure(build, inputs, loss_fn, batch_size, args, device))
+                results.append(record)
+                print('{:>20} b={:<4} t={:<3} forward {:9.1f}/s  backward {:9.1f}/s  '
+                      'train step {:9.1f}/s  peak {:8.2f}MiB'.format(name, batch_size, record['Threads'],
+                                                                     record['Forward'], record['Backward'],
+                                                                     record['Train step'], record['Peak memory']))
+    torch.set_num_threads(default_threads)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        f.write(json.dumps({'Environment': environment(device),
+                            'Units': {'Forward': 'samples/s, eval() under no_grad',
+                                      'Backward': 'samples/s, forward and backward',
+                                      'Train step': 'samples/s, forward, backward and Adam step',
+                                      'Peak memory': 'MiB'
+                                      },
+                            'Results': results
+                            }, indent=2))
+    print('> Results written to {}'.format(args.output))
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance)
+        for name, metric, previous, current in regressions:
+            print('> Regression {}: {} {:.2f} -> {:.2f} ({:+.1f}%)'.format(
+                name, metric, previous, current, (current / previous - 1) * 100))
+        if baseline['Environment'] != environment(device):
+            print('> Baseline recorded on a different environment: {}'.format(baseline['Environment']))
+        if regressions:
+            sys.exit(1)
+        print('> No regressions against {} (tolerance {:.0%})'.format(args.baseline, args.tolerance))
+
+
+if __name__ == '__main__':
+    main()
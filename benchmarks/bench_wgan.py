@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 27/10/26 10:30 AM
+@description: Time per Generator step of the previous WGAN-GP critic loop vs BaseExperiment.train_batch
+@version: 1.0
+"""
+
+
+import time
+import torch
+from torch import autograd
+from GAN_train.train import BaseExperiment, get_parser
+
+
+def legacy_gradient_penalty(exp, x_real, x_fake, batch_size, beta=0.3):
+    x_real = x_real.detach()
+    x_fake = x_fake.detach()
+    alpha = torch.rand(batch_size, 1)
+    alpha = alpha.expand_as(x_real)
+    interpolates = alpha * x_real + ((1 - alpha) * x_fake)
+    interpolates.requires_grad_()
+    dis_interpolates = exp.Discriminator(interpolates)
+    gradients = autograd.grad(outputs=dis_interpolates, inputs=interpolates,
+                              grad_outputs=torch.ones_like(dis_interpolates),
+                              create_graph=True, retain_graph=True, only_inputs=True)[0]
+    return ((gradients.norm(2, dim=1) - 1) ** 2).mean() * beta
+
+
+def legacy_batch(exp, data_real, gen_optimizer, dis_optimizer):
+    """
+    The critic loop as it was, dis_optimizer over the Generator included
+    """
+    batch_size = data_real.size(0)
+    for _ in range(5):
+        pred_real = exp.Discriminator(data_real)
+        loss_real = - pred_real.mean()
+        z = torch.randn(batch_size, exp.args.dim_noise)
+        data_fake = exp.Generator(z).detach()
+        pred_fake = exp.Discriminator(data_fake)
+        loss_fake = pred_fake.mean()
+        if exp.args.model_name == 'WGAN':
+            grad_penalty = legacy_gradient_penalty(exp, data_real, data_fake, batch_size)
+        else:
+            grad_penalty = 0
+        dis_loss = loss_real + loss_fake + grad_penalty
+        dis_optimizer.zero_grad()
+        dis_loss.backward()
+        dis_optimizer.step()
+    pred_fake = exp.Discriminator(data_fake)
+    gen_loss = - pred_fake.mean()
+    gen_optimizer.zero_grad()
+    gen_loss.backward()
+    gen_optimizer.step()
+
+
+def step_time(exp, batch, gen_optimizer, dis_optimizer, num_step):
+    data = exp.data_loader.data
+    t0 = time.time()
+    for i in range(num_step):
+        start = (i * exp.args.batch_size) % (data.size(0) - exp.args.batch_size)
+        batch(data[start: start + exp.args.batch_size], gen_optimizer, dis_optimizer)
+    return (time.time() - t0) / num_step
+
+
+def main():
+    parser = get_parser()
+    parser.add_argument('--num_samples', default=2048, type=int)
+    parser.add_argument('--num_step', default=100, type=int)
+    args = parser.parse_args()
+    dataset = torch.rand(args.num_samples, args.dim_input)
+    exp = BaseExperiment(args, dataset=dataset)
+    legacy_time = step_time(exp,
+                            lambda x, g, d: legacy_batch(exp, x, g, d),
+                            exp.select_optimizer(exp.Generator),
+                            exp.select_optimizer(exp.Generator),
+                            args.num_step
+                            )
+    exp = BaseExperiment(args, dataset=dataset)
+    new_time = step_time(exp,
+                         exp.train_batch,
+                         exp.select_optimizer(exp.Generator),
+                         exp.select_optimizer(exp.Discriminator),
+                         args.num_step
+                         )
+    print('Previous loop: {:2f}ms per Generator step'.format(legacy_time * 1e3))
+    print('train_batch:   {:2f}ms per Generator step (n_critic {}, gradient penalty every {})'.format(
+        new_time * 1e3, args.n_critic, args.gp_every))
+    print('Speed-up: {:2f}x'.format(legacy_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
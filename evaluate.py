@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 19/10/26 9:30 AM
+@description: Score every dataset against each trained AutoEncoder of the sweep in one process
+@version: 1.0
+"""
+
+
+import copy
+import time
+import argparse
+import test
+
+
+testsets = {}  # (dataset, len_seg, net_name) -> testset, shared by all models of the same layout
+
+
+def get_testset(args, dataset):
+    key = (dataset, args.len_seg, args.net_name)
+    if key not in testsets:
+        testsets[key] = test.load_testset(args, dataset)
+    return testsets[key]
+
+
+def grid(args, base):
+    jobs = []
+    for len_seg in args.len_segs:
+        for net_name in args.net_names:
+            if net_name == 'MLP':
+                num_epoch, alpha, num_hidden_maps = args.num_epoch_mlp, args.alpha_mlp, [base.num_hidden_map]
+            else:
+                num_epoch, alpha, num_hidden_maps = args.num_epoch_conv, args.alpha_conv, args.num_hidden_maps
+            for num_hidden_map in num_hidden_maps:
+                job = copy.copy(base)
+                job.dataset = args.datasets[0]
+                job.len_seg = len_seg
+                job.net_name = net_name
+                job.num_epoch = num_epoch
+                job.alpha = alpha
+                job.num_hidden_map = num_hidden_map
+                jobs.append(job)
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datasets', default=['WN2', 'WN3', 'WN4'], nargs='+', type=str)
+    parser.add_argument('--len_segs', default=[300, 400, 500], nargs='+', type=int)
+    parser.add_argument('--net_names', default=['MLP', 'Conv2D'], nargs='+', type=str)
+    parser.add_argument('--num_hidden_maps', default=[256, 128, 64, 32], nargs='+', type=int)
+    parser.add_argument('--num_epoch_mlp', default=10000, type=int)
+    parser.add_argument('--num_epoch_conv', default=1000, type=int)
+    parser.add_argument('--alpha_mlp', default=20, type=float)
+    parser.add_argument('--alpha_conv', default=100, type=float)
+    args, test_args = parser.parse_known_args()
+    # Remaining arguments are forwarded to every test.py job
+    base = test.get_parser().parse_args(test_args)
+    t0 = time.time()
+    for job in grid(args, base):
+        detector = test.DamageDetection(job, testset=get_testset(job, args.datasets[0]))
+        detector.load_model()  # Loaded once, scored against every dataset
+        print('\033[1;32m[{}]\033[0m'.format(detector.file_name()))
+        for dataset in args.datasets:
+            detector.detect(dataset, get_testset(job, dataset))
+    print('> Evaluation finished in {:2f}s'.format(time.time() - t0))
+
+
+if __name__ == '__main__':
+    main()
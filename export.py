@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 25/10/26 11:00 AM
+@description: Export a trained AutoEncoder for the torch-free NumPy runtime
+@version: 1.0
+"""
+
+
+import os
+import time
+import tempfile
+import argparse
+import numpy as np
+import torch
+import test
+from models.AutoEncoder import AutoEncoder
+from models.registry import export_path, ModelRegistry
+from utils.export import export
+from utils import numpy_runtime
+
+
+# The checkpoint's own AutoEncoderConv, not the Conv1d network test.registry swaps in
+registry = ModelRegistry(device=test.device, optimize=False)
+
+
+def validate(args, model, runtime, dataset):
+    """
+    Largest deviation of the NumPy runtime from the torch model over the
+    testset of dataset, for the outputs and the per-spot damage indices
+    """
+    testset = test.load_testset(args, dataset)
+    errors = {'Output': 0., 'z': 0., 'z_hat': 0., 'Damage index': 0.}
+    with torch.no_grad():
+        for spot in range(testset.size(0)):
+            x = testset[spot]
+            if args.net_name == 'Conv2D': x = x.unsqueeze(2)
+            expected = [t.cpu().numpy() for t in model(x.to(next(model.parameters()).device))]
+            outputs = runtime(x.numpy())
+            for key, a, b in zip(('Output', 'z', 'z_hat'), expected, outputs):
+                errors[key] = max(errors[key], float(np.abs(a - b).max()))
+            loss_x = ((x.numpy() - expected[0]) ** 2).reshape(x.size(0), -1).mean(1).mean()
+            loss_z = ((expected[1] - expected[2]) ** 2).reshape(x.size(0), -1).mean(1).mean()
+            loss = args.beta * loss_x + (1 - args.beta) * loss_z
+            errors['Damage index'] = max(errors['Damage index'],
+                                         abs(float(numpy_runtime.damage_index(loss, args.alpha)) -
+                                             float(runtime.damage_index(x.numpy(), args.alpha, args.beta))))
+    return errors
+
+
+def check(base, tolerance, num_segments=64):
+    """
+    Export untrained MLP and Conv2D AutoEncoders, with random BatchNorm
+    statistics and as loaded by both registries, and compare the NumPy
+    runtime with torch on random spectra, no trained model or data needed
+    :return: {case: largest output deviation}
+    """
+    torch.manual_seed(base.seed)
+    errors = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for net_name in ('MLP', 'Conv2D'):
+            args = argparse.Namespace(**vars(base))
+            args.net_name = net_name
+            model = AutoEncoder(args)
+            for module in model.modules():
+                if isinstance(module, torch.nn.BatchNorm2d):
+                    module.running_mean.uniform_(-0.1, 0.1)
+                    module.running_var.uniform_(0.5, 2)
+            model.eval()
+            x = torch.rand(num_segments, args.dim_input) if net_name == 'MLP' else \
+                torch.rand(num_segments, 3, 1, args.dim_input // 3)
+            for optimize in (False, True):
+                if optimize: model.optimize_for_inference()
+                path = '{}/{}_{}.npz'.format(tmp, net_name, optimize)
+                export(model, path)
+                with torch.no_grad():
+                    expected = [t.numpy() for t in model(x)]
+                outputs = numpy_runtime.AutoEncoder(path)(x.numpy())
+                case = '{} ({})'.format(net_name, 'optimized' if optimize else 'as trained')
+                errors[case] = max(float(np.abs(a - b).max()) for a, b in zip(expected, outputs))
+                print('>>> {}: max abs error {:5e}'.format(case, errors[case]))
+    if max(errors.values()) > tolerance:
+        raise SystemExit('NumPy runtime deviates from torch by more than {}'.format(tolerance))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tolerance', default=1e-4, type=float)
+    # Export check of both net types on untrained models instead of exporting a checkpoint
+    parser.add_argument('--check', action='store_true')
+    args, test_args = parser.parse_known_args()
+    # Remaining arguments select the trained model, as for test.py
+    base = test.get_parser().parse_args(test_args)
+    if args.check:
+        check(base, args.tolerance)
+        return
+    model = registry.get(base)
+    path = export_path(base)
+    export(model, path)
+    t0 = time.time()
+    runtime = numpy_runtime.AutoEncoder(path)
+    print('> {}: {:.2f}KiB, loaded in {:.2f}ms'.format(os.path.basename(path),
+                                                   os.path.getsize(path) / 2 ** 10,
+                                                   (time.time() - t0) * 1e3
+                                                   ))
+    errors = validate(base, model, runtime, base.dataset)
+    for key, error in errors.items():
+        print('>>> {}: max abs error {:5e}'.format(key, error))
+    if max(errors.values()) > args.tolerance:
+        raise SystemExit('NumPy runtime deviates from torch by more than {}'.format(args.tolerance))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 26/10/26 2:30 PM
+@description: Inference-only Conv1d form of AutoEncoderConv with BatchNorm folded
+@version: 1.0
+"""
+
+
+import torch
+from torch import nn
+from utils.export import fold_layers
+
+
+def build(layers):
+    """
+    nn.Sequential of the folded layers returned by utils.export.fold_layers
+    """
+    modules = []
+    for layer in layers:
+        if layer['op'] in ('conv', 'deconv'):
+            weight = layer['weight']
+            if layer['op'] == 'conv':
+                module = nn.Conv1d(weight.size(1), weight.size(0), kernel_size=weight.size(2),
+                                   stride=layer['stride'], padding=layer['padding'])
+            else:
+                module = nn.ConvTranspose1d(weight.size(0), weight.size(1), kernel_size=weight.size(2),
+                                            stride=layer['stride'], padding=layer['padding'])
+            module.weight.data.copy_(weight)
+            module.bias.data.copy_(layer['bias'])
+            modules.append(module)
+        elif layer['op'] == 'leaky_relu':
+            modules.append(nn.LeakyReLU(layer['slope'], inplace=True))
+        elif layer['op'] == 'relu':
+            modules.append(nn.ReLU(True))
+        elif layer['op'] == 'sigmoid':
+            modules.append(nn.Sigmoid())
+        else:
+            raise ValueError('Not a layer of AutoEncoderConv: {}'.format(layer['op']))
+    return nn.Sequential(*modules)
+
+
+class AutoEncoderConv1D(nn.Module):
+    """
+    AutoEncoderConv runs (1, 4) kernels over a height of 1, which are 1D
+    convolutions, each followed by a BatchNorm2d that eval() turns into an
+    affine map. Here the convolutions are Conv1d/ConvTranspose1d with that
+    map folded into their weights and bias. Same [b, 3, 1, 128] input and
+    output shapes as AutoEncoderConv
+    """
+
+    def __init__(self, net):
+        super(AutoEncoderConv1D, self).__init__()
+        self.args = net.args
+        with torch.no_grad():
+            self.encoder = build(fold_layers(net.encoder))
+            self.decoder = build(fold_layers(net.decoder))
+            self.encoder_ = build(fold_layers(net.encoder_))
+        self.to(next(net.parameters()).device)
+        self.eval()
+
+    def forward(self, x):
+        z = self.encoder(x.squeeze(2))
+        output = self.decoder(z)
+        z_hat = self.encoder_(output)
+        return output.unsqueeze(2), z.unsqueeze(2), z_hat.unsqueeze(2)
@@ -11,8 +11,10 @@
 """
 
 
+import torch
 from torch import nn
 from layers.AE import AutoEncoder, AutoEncoderConv
+from layers.AE1D import AutoEncoderConv1D
 
 
 net_classes = {'MLP': AutoEncoder,
@@ -35,3 +37,24 @@ class AutoEncoder(nn.Module):
         else:
             output, z, z_hat = self.AE(x)
             return output, z, z_hat
+
+    def optimize_for_inference(self, tolerance=1e-4):
+        """
+        Switch to eval() and swap a trained AutoEncoderConv for the equivalent
+        BatchNorm-folded AutoEncoderConv1D, kept only if both agree within
+        tolerance on a probe batch of spectra-like inputs in [0, 1]
+        :return: largest output deviation of the optimized network
+        """
+        self.eval()
+        if not isinstance(self.AE, AutoEncoderConv) or self.args.model_name == 'VAE':
+            return 0.
+        fast = AutoEncoderConv1D(self.AE)
+        probe = torch.rand(16, 3, 1, self.args.dim_input // 3,
+                           generator=torch.Generator().manual_seed(0)).to(next(self.parameters()).device)
+        with torch.no_grad():
+            error = max((a - b).abs().max().item() for a, b in zip(self.AE(probe), fast(probe)))
+        if error > tolerance:
+            print('> Conv1d network deviates by {:5e} > {}, keeping AutoEncoderConv'.format(error, tolerance))
+            return error
+        self.AE = fast
+        return error
@@ -0,0 +1,38 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 24/10/26 9:40 AM
+@description: Dynamically int8 quantized MLP AutoEncoder for inference
+@version: 1.0
+"""
+
+
+import torch
+from torch import nn
+from torch.ao.quantization import quantize_dynamic
+from models.AutoEncoder import AutoEncoder
+
+
+class QuantizedAutoEncoder(nn.Module):
+    """
+    AutoEncoder with every Linear layer of encoder, decoder and encoder_
+    dynamically quantized: int8 weights with a per-tensor scale, activations
+    quantized per batch on the fly. Inference only
+    :param model: trained fp32 AutoEncoder to quantize, an untrained one is
+                  built when the quantized state_dict is loaded afterwards
+    """
+
+    def __init__(self, args, model=None):
+        super(QuantizedAutoEncoder, self).__init__()
+        if args.net_name != 'MLP':
+            raise ValueError('Dynamic int8 quantization only covers the Linear layers of the MLP AutoEncoder')
+        self.args = args
+        model = AutoEncoder(args) if model is None else model
+        self.AE = quantize_dynamic(model.eval(), {nn.Linear}, dtype=torch.qint8)
+
+    def forward(self, x):
+        return self.AE(x)
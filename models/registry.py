@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 19/10/26 2:15 PM
+@description: Experiment naming, checkpoint paths and an LRU cache of loaded models
+@version: 1.0
+"""
+
+
+from collections import OrderedDict
+import torch
+from models.AutoEncoder import AutoEncoder
+from models.QuantizedAutoEncoder import QuantizedAutoEncoder
+from models.Generator import Generator
+from models.Discriminator import Discriminator
+from utils.precision import tag
+
+
+save_path = './results'
+
+model_classes = {'AE': AutoEncoder,
+                 'AE_int8': QuantizedAutoEncoder,
+                 'Gen': Generator,
+                 'Dis': Discriminator
+                 }
+
+
+def file_name(args):
+    # Models trained at a reduced precision are tagged, the fp32 ones keep their names
+    return base_name(args) + tag(getattr(args, 'train_precision', 'fp32'))
+
+
+def base_name(args):
+    # GAN experiments have no num_hidden_map and always use the short name
+    if args.net_name == 'MLP' or not hasattr(args, 'num_hidden_map'):
+        return '{}_{}_{}_{}_{}_{}'.format(args.model_name,
+                                          args.net_name,
+                                          args.len_seg,
+                                          args.optimizer,
+                                          args.learning_rate,
+                                          args.num_epoch
+                                          )
+    else:
+        return '{}_{}_{}_{}_{}_{}_{}'.format(args.model_name,
+                                             args.net_name,
+                                             args.len_seg,
+                                             args.optimizer,
+                                             args.learning_rate,
+                                             args.num_epoch,
+                                             args.num_hidden_map
+                                             )
+
+
+def checkpoint_path(args, kind='AE'):
+    if kind == 'AE':
+        return '{}/models/{}/{}.model'.format(save_path, args.model_name, file_name(args))
+    elif kind == 'AE_int8':
+        return '{}/models/{}/{}_int8.model'.format(save_path, args.model_name, file_name(args))
+    else:
+        return '{}/models/{}_{}.model'.format(save_path, file_name(args), kind)
+
+
+def export_path(args):
+    # NumPy runtime weights written by export.py, next to the checkpoint
+    return '{}/models/{}/{}.npz'.format(save_path, args.model_name, file_name(args))
+
+
+def load_state_dict(path, map_location='cpu'):
+    """
+    torch.load with the storages memory-mapped instead of read into memory,
+    falls back to a plain load for older torch or legacy checkpoint formats
+    """
+    try:
+        return torch.load(path, map_location=map_location, mmap=True, weights_only=True)
+    except (TypeError, RuntimeError):
+        return torch.load(path, map_location=map_location)
+
+
+def model_size(model):
+    def size(value):
+        if torch.is_tensor(value):
+            return value.numel() * value.element_size()
+        if isinstance(value, (tuple, list)):
+            return sum(size(v) for v in value)
+        return 0
+    # The state_dict also holds the packed weights of dynamically quantized layers
+    return sum(size(v) for v in model.state_dict().values())
+
+
+class ModelRegistry:
+    """
+    Ready-to-run eval() models keyed by checkpoint path, loaded on first use
+    and evicted least recently used first once the budget (bytes) is exceeded.
+    With optimize, AutoEncoders go through optimize_for_inference on load
+    """
+
+    def __init__(self, budget=512 * 2 ** 20, device='cpu', optimize=True):
+        self.budget = budget
+        self.device = device
+        self.optimize = optimize
+        self.models = OrderedDict()
+        self.size = 0
+
+    def __contains__(self, path):
+        return path in self.models
+
+    def get(self, args, kind='AE'):
+        path = checkpoint_path(args, kind)
+        if path in self.models:
+            self.models.move_to_end(path)
+            return self.models[path]
+        # Dynamically quantized kernels only run on the CPU
+        device = 'cpu' if kind == 'AE_int8' else self.device
+        model = model_classes[kind](args)
+        model.load_state_dict(load_state_dict(path, map_location=device))
+        model.to(device).eval()
+        if self.optimize and kind == 'AE':
+            model.optimize_for_inference()
+        self.models[path] = model
+        self.size += model_size(model)
+        # The model just loaded is always kept, even if it alone exceeds the budget
+        while self.size > self.budget and len(self.models) > 1:
+            _, evicted = self.models.popitem(last=False)
+            self.size -= model_size(evicted)
+        return model
+
+    def clear(self):
+        self.models.clear()
+        self.size = 0
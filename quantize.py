@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 24/10/26 10:20 AM
+@description: Post-training dynamic int8 quantization of a trained MLP AutoEncoder
+@version: 1.0
+"""
+
+
+import os
+import copy
+import argparse
+import test
+from models.QuantizedAutoEncoder import QuantizedAutoEncoder
+from models.registry import checkpoint_path, model_size
+from utils.checkpoint import atomic_save
+
+
+def quantize(args):
+    """
+    Write the int8 copy of the trained model next to it as {file}_int8.model
+    """
+    model = test.registry.get(args)
+    quantized = QuantizedAutoEncoder(args, model=copy.deepcopy(model).cpu())
+    path = checkpoint_path(args, 'AE_int8')
+    atomic_save(quantized.state_dict(), path)
+    print('> {}: {:.2f}KiB fp32 -> {:.2f}KiB int8 ({:.2f}KiB on disk)'.format(os.path.basename(path),
+                                                                      model_size(model) / 2 ** 10,
+                                                                      model_size(quantized) / 2 ** 10,
+                                                                      os.path.getsize(path) / 2 ** 10
+                                                                      ))
+
+
+def validate(args, datasets):
+    """
+    Score every dataset with the fp32 and the int8 model, test.py writes the
+    per-spot losses and damage index changes to {dataset}_{file}_int8_report.json
+    """
+    for dataset in datasets:
+        testset = test.load_testset(args, dataset)
+        for precision in ('fp32', 'int8'):
+            job = copy.copy(args)
+            job.precision = precision
+            detector = test.DamageDetection(job, testset=testset)
+            detector.load_model()
+            detector.detect(dataset, testset)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datasets', default=None, nargs='+', type=str)
+    args, test_args = parser.parse_known_args()
+    # Remaining arguments select the trained model, as for test.py
+    base = test.get_parser().parse_args(test_args)
+    quantize(base)
+    validate(base, args.datasets or [base.dataset])
+
+
+if __name__ == '__main__':
+    main()
@@ -14,12 +14,15 @@
 import torch
 import numpy as np
 import matplotlib.pyplot as plt
-from data_processing.dataset_reader import DatasetReader
+from utils.dataset_cache import CachedDatasetReader
 from models.AutoEncoder import AutoEncoder
+from models.registry import file_name, checkpoint_path, load_state_dict
+from utils.precision import autocast
 import argparse
 
 
 data_path = './data/data_processed'
+cache_path = './data/cache'
 info_path = './data/info'
 save_path = './results'
 
@@ -30,11 +33,12 @@ class Reconstruction:
 
     def __init__(self, args):
         self.args = args
-        white_noise = DatasetReader(white_noise='W-1',
-                                    data_path=data_path,
-                                    data_source=args.data_source,
-                                    len_seg=self.args.len_seg
-                                    )
+        white_noise = CachedDatasetReader(white_noise='W-1',
+                                          data_path=data_path,
+                                          cache_path=cache_path,
+                                          data_source=args.data_source,
+                                          len_seg=self.args.len_seg
+                                          )
         self.dataset, _ = white_noise(args.net_name)
         self.spots = np.load('{}/spots.npy'.format(info_path))
         self.AE = AutoEncoder(args)
@@ -46,30 +50,12 @@ class Reconstruction:
                      }
 
     def file_name(self):
-        if self.args.net_name == 'MLP':
-            return '{}_{}_{}_{}_{}_{}'.format(self.args.model_name,
-                                              self.args.net_name,
-                                              self.args.len_seg,
-                                              self.args.optimizer,
-                                              self.args.learning_rate,
-                                              self.args.num_epoch
-                                              )
-        else:
-            return '{}_{}_{}_{}_{}_{}_{}'.format(self.args.model_name,
-                                                 self.args.net_name,
-                                                 self.args.len_seg,
-                                                 self.args.optimizer,
-                                                 self.args.learning_rate,
-                                                 self.args.num_epoch,
-                                                 self.args.num_hidden_map
-                                                 )
+        return file_name(self.args)
 
     def load_model(self):
-        path = '{}/models/{}/{}.model'.format(save_path,
-                                              self.args.model_name,
-                                              self.file_name()
-                                              )
-        self.AE.load_state_dict(torch.load(path, map_location=torch.device(device)))  # Load AutoEncoder
+        path = checkpoint_path(self.args)
+        self.AE.load_state_dict(load_state_dict(path, map_location=torch.device(device)))  # Load AutoEncoder
+        self.AE.to(device).optimize_for_inference()  # eval(), Conv1d network with BatchNorm folded
 
     def show_reconstruct(self):
         self.load_model()
@@ -88,7 +74,9 @@ class Reconstruction:
                 axs[i][0].set_title('{}-{}'.format(spot_l1, seg_idx), fontdict=self.font)
                 axs[i][0].plot(x.view(-1).detach().cpu().numpy(), c='b', lw=1, label='Original')
                 if self.args.net_name == 'Conv2D': x = x.unsqueeze(0).unsqueeze(2)
-                x_hat, _, _ = self.AE(x)
+                with autocast(self.args.precision, device):
+                    x_hat, _, _ = self.AE(x)
+                x_hat = x_hat.float()
                 axs[i][0].plot(x_hat.view(-1).detach().cpu().numpy(),
                                ls='--',
                                lw=1,
@@ -107,12 +95,14 @@ class Reconstruction:
                                  prop={'size': 8}
                                  )
                 # L2 sensors
-                x = self.dataset[(i + 5) * num_seg + seg_idx]
+                x = self.dataset[(i + len(spots_l1)) * num_seg + seg_idx]
                 x = x.to(device)
                 axs[i][1].plot(x.view(-1).detach().cpu().numpy(), c='b', lw=1, label='Original')
                 axs[i][1].set_title('{}-{}'.format(spot_l2, seg_idx), fontdict=self.font)
                 if self.args.net_name == 'Conv2D': x = x.unsqueeze(0).unsqueeze(2)
-                x_hat, _, _ = self.AE(x)
+                with autocast(self.args.precision, device):
+                    x_hat, _, _ = self.AE(x)
+                x_hat = x_hat.float()
                 axs[i][1].plot(x_hat.view(-1).detach().cpu().numpy(),
                                ls='--',
                                lw=1,
@@ -147,7 +137,9 @@ class Reconstruction:
                 x = x.to(device)
                 axs[i][0].set_title('{}-{}'.format(spot_l1, seg_idx))
                 if self.args.net_name == 'Conv2D': x = x.unsqueeze(0).unsqueeze(2)
-                _, z, z_hat = self.AE(x)
+                with autocast(self.args.precision, device):
+                    _, z, z_hat = self.AE(x)
+                z, z_hat = z.float(), z_hat.float()
                 axs[i][0].plot(z.view(-1).detach().cpu().numpy(),
                                ls='--',
                                lw=1,
@@ -164,11 +156,13 @@ class Reconstruction:
                                  prop={'size': 8}
                                  )
                 # L2 sensors
-                x = self.dataset[(i + 5) * num_seg + seg_idx]
+                x = self.dataset[(i + len(spots_l1)) * num_seg + seg_idx]
                 x = x.to(device)
                 axs[i][1].set_title('{}-{}'.format(spot_l2, seg_idx))
                 if self.args.net_name == 'Conv2D': x = x.unsqueeze(0).unsqueeze(2)
-                _, z, z_hat = self.AE(x)
+                with autocast(self.args.precision, device):
+                    _, z, z_hat = self.AE(x)
+                z, z_hat = z.float(), z_hat.float()
                 axs[i][1].plot(z.view(-1).detach().cpu().numpy(),
                                ls='--',
                                lw=1,
@@ -195,6 +189,10 @@ if __name__ == '__main__':
     parser.add_argument('--len_seg', default=500, type=int)
     parser.add_argument('--optimizer', default='Adam', type=str)
     parser.add_argument('--seg_idx', default=25, type=int)
+    # fp32, or bf16 autocast of the forward pass
+    parser.add_argument('--precision', default='fp32', type=str)
+    # Precision the model was trained at (train.py --precision), selects its checkpoint
+    parser.add_argument('--train_precision', default='fp32', type=str)
     # MLP setting
     parser.add_argument('--dim_input', default=384, type=int)
     parser.add_argument('--dim_feature', default=20, type=int)
@@ -11,42 +11,35 @@
 """
 
 
-import visdom
+import os
 import argparse
+from models.registry import file_name
+from utils.metrics import VisdomMetrics, replay_jsonl
 
 
 class Replay:
 
     def __init__(self, args):
         self.args = args
-        self.vis = visdom.Visdom()
 
     def __call__(self, *args, **kwargs):
         self.replay_log()
 
     def file_name(self):
-        if self.args.net_name == 'MLP':
-          return '{}_{}_{}_{}_{}_{}'.format(self.args.model_name,
-                                            self.args.net_name,
-                                            self.args.len_seg,
-                                            self.args.optimizer,
-                                            self.args.learning_rate,
-                                            self.args.num_epoch
-                                            )
-        else:
-          return '{}_{}_{}_{}_{}_{}_{}'.format(self.args.model_name,
-                                               self.args.net_name,
-                                               self.args.len_seg,
-                                               self.args.optimizer,
-                                               self.args.learning_rate,
-                                               self.args.num_epoch,
-                                               self.args.num_hidden_map
-                                               )
+        return file_name(self.args)
 
     def replay_log(self):
-        self.vis.replay_log(log_filename='./results/visualization/{}.log'.
-                            format(self.file_name())
-                            )
+        """
+        Replay the visdom event log of the run, or the file of its JSONL
+        metrics sink (--metrics jsonl) when there is no log
+        """
+        path = './results/visualization/{}'.format(self.file_name())
+        metrics = VisdomMetrics(env=self.file_name())
+        if self.args.source == 'log' or (self.args.source is None and os.path.exists(path + '.log')):
+            metrics.vis.replay_log(log_filename=path + '.log')
+        else:
+            replay_jsonl(path + '.jsonl', metrics)
+        metrics.close()
 
 
 def main():
@@ -60,6 +53,8 @@ def main():
     parser.add_argument('--num_hidden_map', default=256, type=int)
     parser.add_argument('--num_epoch', default=1000, type=int)
     parser.add_argument('--learning_rate', default=1e-3, type=float)
+    # log (visdom event log) or jsonl, the log if it exists by default
+    parser.add_argument('--source', default=None, type=str)
     args = parser.parse_args()
     replay = Replay(args)
     replay()
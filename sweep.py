@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 18/10/26 2:40 PM
+@description: Hyperparameter sweep over train.BaseExperiment on a process pool
+@version: 1.0
+"""
+
+
+import os
+import copy
+import time
+import json
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import torch
+from utils.dataset_cache import CachedDatasetReader
+import train
+
+
+datasets = {}  # (len_seg, net_name) -> shared training tensor, inherited by the forked workers
+
+
+def grid(args, base):
+    jobs = []
+    for len_seg in args.len_segs:
+        for net_name in args.net_names:
+            if net_name == 'MLP':
+                num_epoch, num_hidden_maps = args.num_epoch_mlp, [base.num_hidden_map]
+            else:
+                num_epoch, num_hidden_maps = args.num_epoch_conv, args.num_hidden_maps
+            for num_hidden_map in num_hidden_maps:
+                job = copy.copy(base)
+                job.len_seg = len_seg
+                job.net_name = net_name
+                job.num_epoch = num_epoch
+                job.num_hidden_map = num_hidden_map
+                jobs.append(job)
+    # Longest jobs first, the grid then finishes close to the slowest job
+    return sorted(jobs, key=lambda job: (job.num_epoch, job.num_hidden_map), reverse=True)
+
+
+def load_datasets(jobs):
+    for job in jobs:
+        key = (job.len_seg, job.net_name)
+        if key in datasets:
+            continue
+        white_noise = CachedDatasetReader(white_noise=job.dataset,
+                                          data_path=train.data_path,
+                                          cache_path=train.cache_path,
+                                          data_source=job.data_source,
+                                          len_seg=job.len_seg
+                                          )
+        dataset, _ = white_noise(job.net_name)
+        datasets[key] = dataset.share_memory_()
+
+
+def init_worker(num_threads):
+    torch.set_num_threads(num_threads)
+
+
+def run(job):
+    t0 = time.time()
+    exp = train.BaseExperiment(job, dataset=datasets[(job.len_seg, job.net_name)])
+    exp.train()
+    return exp.file_name(), time.time() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--len_segs', default=[300, 400, 500], nargs='+', type=int)
+    parser.add_argument('--net_names', default=['MLP', 'Conv2D'], nargs='+', type=str)
+    parser.add_argument('--num_hidden_maps', default=[256, 128, 64, 32], nargs='+', type=int)
+    parser.add_argument('--num_epoch_mlp', default=10000, type=int)
+    parser.add_argument('--num_epoch_conv', default=1000, type=int)
+    parser.add_argument('--num_workers', default=None, type=int)
+    # Headless by default: JSONL files, no visdom connection per job
+    parser.add_argument('--metrics', default='jsonl', type=str)
+    args, train_args = parser.parse_known_args()
+    # Remaining arguments are forwarded to every train.py job
+    base = train.get_parser().parse_args(train_args)
+    base.metrics = args.metrics
+    jobs = grid(args, base)
+    num_workers = args.num_workers or min(len(jobs), os.cpu_count())
+    num_threads = max(1, os.cpu_count() // num_workers)
+    print('> {} jobs on {} workers x {} threads'.format(len(jobs), num_workers, num_threads))
+    # Keep the parent single-threaded so the forked workers start from a clean thread pool
+    torch.set_num_threads(1)
+    load_datasets(jobs)
+    wall_times = {}
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=num_workers,
+                             mp_context=multiprocessing.get_context('fork'),
+                             initializer=init_worker,
+                             initargs=(num_threads,)
+                             ) as executor:
+        futures = [executor.submit(run, job) for job in jobs]
+        for future in as_completed(futures):
+            name, wall_time = future.result()
+            wall_times[name] = wall_time
+            print('\033[1;32m[{}]\033[0m\tWall time: {:2f}s'.format(name, wall_time))
+    sweep = {'Jobs': wall_times,
+             'Workers': num_workers,
+             'Threads per worker': num_threads,
+             'Total wall time': time.time() - t0
+             }
+    print('> Sweep finished in {:2f}s'.format(sweep['Total wall time']))
+    with open('{}/learning history/sweep.json'.format(train.save_path), 'w') as f:
+        f.write(json.dumps(sweep, indent=2))
+
+
+if __name__ == '__main__':
+    main()
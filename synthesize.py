@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 28/10/26 4:00 PM
+@description: Synthetic white-noise datasets of any size for load-testing training and detection
+@version: 1.0
+"""
+
+
+import os
+import time
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils.dataset_cache import CachedDatasetReader
+from utils.fft_segmentation import num_bins
+from utils.synthetic_response import element_stiffness, modes, write_chunk, write_segments
+
+
+def wait(futures):
+    for future in futures:
+        future.result()
+
+
+def write_records(executor, args, data_path):
+    """
+    One [num_spots, num_channels, num_samples] record file per dataset under
+    {data_path}/{dataset}/records.npy, synthesized chunk by chunk on the pool.
+    Damage is a stiffness reduction of damage_elements by the dataset's level
+    :return: {dataset: natural frequencies in Hz}
+    """
+    ratios = [1 + 0.3 * c for c in range(args.num_channels)]
+    frequencies = {}
+    futures = []
+    for i, (dataset, level) in enumerate(zip(args.datasets, args.damage_levels)):
+        damage = {element: level for element in args.damage_elements} if level > 0 else None
+        omega, shapes = modes(element_stiffness(args.num_spots, damage), args.num_modes, args.frequency)
+        frequencies[dataset] = (omega / (2 * np.pi)).tolist()
+        path = '{}/{}/records.npy'.format(data_path, dataset)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                  shape=(args.num_spots, args.num_channels, args.num_samples))
+        for start in range(0, args.num_samples, args.chunk_size):
+            futures.append(executor.submit(write_chunk, path, omega, shapes,
+                                           start, min(start + args.chunk_size, args.num_samples),
+                                           [args.seed, i], args.zeta, args.fs, ratios, args.noise_ratio))
+    wait(futures)
+    return frequencies
+
+
+def write_cache(executor, args, data_path, cache_path):
+    """
+    The MLP and Conv2D train/test sets and the raw set of every dataset and
+    len_seg as CachedDatasetReader entries, so train.py and test.py never
+    call DatasetReader on the synthetic records. The raw set is keyed without
+    data_source, as GAN_train/test.py reads it. Train and test spectra share
+    the default fft_segmentation.spectra normalization, models trained on
+    real DatasetReader sets see them as such only if test.py --check_spectra
+    confirms that default
+    """
+    for dataset in args.datasets:
+        records_path = '{}/{}/records.npy'.format(data_path, dataset)
+        for len_seg in args.len_segs:
+            num_seg = (args.num_samples - len_seg) // len_seg + 1
+            dim = args.num_channels * num_bins
+            shapes = {'MLP': {'train': (args.num_spots * num_seg, dim),
+                              'test': (args.num_spots, num_seg, dim)},
+                      'Conv2D': {'train': (args.num_spots * num_seg, args.num_channels, num_bins),
+                                 'test': (args.num_spots, num_seg, args.num_channels, num_bins)},
+                      'raw': {'train': (args.num_spots, num_seg, dim)}
+                      }
+            readers, entries, paths = {}, {}, {}
+            for layout, layout_shapes in shapes.items():
+                readers[layout] = CachedDatasetReader(white_noise=dataset,
+                                                      data_path=data_path,
+                                                      cache_path=cache_path,
+                                                      data_source=None if layout == 'raw' else args.data_source,
+                                                      len_seg=len_seg
+                                                      )
+                entries[layout] = readers[layout].entry(layout)
+                paths[layout] = readers[layout].allocate(entries[layout], **layout_shapes)
+            wait([executor.submit(write_segments, records_path, paths,
+                                  (start, min(start + args.spots_per_task, args.num_spots)), len_seg, num_seg)
+                  for start in range(0, args.num_spots, args.spots_per_task)])
+            for layout in shapes:
+                # DatasetReader returns the segment sets as tensors and dataset_ as an ndarray
+                readers[layout].commit(entries[layout], dict(paths[layout], test=paths[layout].get('test')),
+                                       kinds={'train': 'ndarray' if layout == 'raw' else 'tensor'})
+            print('> {} len_seg {}: {} segments per spot cached'.format(dataset, len_seg, num_seg))
+
+
+def is_real_data(root):
+    """
+    Whether root has records that no earlier synthesize.py run wrote
+    """
+    data_path = '{}/data_processed'.format(root)
+    if not os.path.isdir(data_path) or not os.listdir(data_path):
+        return False
+    return not os.path.exists('{}/info/synthetic.json'.format(root))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # Everything goes under root as ./data is laid out, run the scripts from its parent, e.g.
+    # cd synthetic && python ../train.py, so they read it as ./data and write ./results there
+    parser.add_argument('--root', default='./synthetic/data', type=str)
+    # Replace an existing spots.npy with a different one
+    parser.add_argument('--overwrite', action='store_true')
+    # Write into a data tree that holds real (not synthesized) records
+    parser.add_argument('--force', action='store_true')
+    parser.add_argument('--datasets', default=['SN1', 'SN2', 'SN3'], nargs='+', type=str)
+    # Stiffness reduction per dataset, 0 for the healthy baseline
+    parser.add_argument('--damage_levels', default=[0., 0.1, 0.3], nargs='+', type=float)
+    # Damaged elements, element e ties spot e - 1 to spot e, the middle one by default
+    parser.add_argument('--damage_elements', default=None, nargs='+', type=int)
+    # Structure: a shear chain with one spot per DOF, one channel per direction
+    parser.add_argument('--num_spots', default=10, type=int)
+    parser.add_argument('--num_channels', default=3, type=int)
+    parser.add_argument('--num_modes', default=20, type=int)
+    parser.add_argument('--frequency', default=1.0, type=float)
+    parser.add_argument('--zeta', default=0.02, type=float)
+    parser.add_argument('--fs', default=100., type=float)
+    parser.add_argument('--num_samples', default=60000, type=int)
+    # Sensor noise, relative to the RMS of each channel
+    parser.add_argument('--noise_ratio', default=0.05, type=float)
+    # Segments cached for these lengths, as swept in train.sh
+    parser.add_argument('--len_segs', default=[300, 400, 500], nargs='+', type=int)
+    parser.add_argument('--data_source', default='FFT', type=str)
+    parser.add_argument('--seed', default=23, type=int)
+    # Work split: samples per synthesis task, spots per segmentation task
+    parser.add_argument('--chunk_size', default=2 ** 16, type=int)
+    parser.add_argument('--spots_per_task', default=64, type=int)
+    parser.add_argument('--num_workers', default=None, type=int)
+    args = parser.parse_args()
+    if len(args.damage_levels) != len(args.datasets):
+        raise ValueError('One damage level per dataset: {} for {}'.format(args.damage_levels, args.datasets))
+    if args.num_spots % 2:
+        raise ValueError('Spots are read as two sensor lines (L1, L2), num_spots must be even')
+    if args.num_modes > args.num_spots:
+        args.num_modes = args.num_spots
+    args.damage_elements = args.damage_elements or [args.num_spots // 2]
+    data_path = '{}/data_processed'.format(args.root)
+    cache_path = '{}/cache'.format(args.root)
+    info_path = '{}/info'.format(args.root)
+    if is_real_data(args.root) and not args.force:
+        raise FileExistsError('{} holds real records, synthetic ones would change the fingerprint of their '
+                              'cache entries and may replace spots.npy, pass --force to write there anyway'.
+                              format(args.root))
+    spots = np.array([str(i + 1) for i in range(args.num_spots)])
+    spots_path = '{}/spots.npy'.format(info_path)
+    if os.path.exists(spots_path) and not args.overwrite and not np.array_equal(np.load(spots_path), spots):
+        raise FileExistsError('{} holds other spots, pass --overwrite to replace them'.format(spots_path))
+    os.makedirs(info_path, exist_ok=True)
+    np.save(spots_path, spots)
+    size = len(args.datasets) * args.num_spots * args.num_channels * args.num_samples * 4
+    print('> {} datasets x {} spots x {} channels x {} samples ({:.2f}GiB of records)'.format(
+        len(args.datasets), args.num_spots, args.num_channels, args.num_samples, size / 2 ** 30))
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=args.num_workers) as executor:
+        frequencies = write_records(executor, args, data_path)
+        t1 = time.time()
+        print('> Records written in {:.2f}s'.format(t1 - t0))
+        # The cache fingerprint covers every record file, so all are written first
+        write_cache(executor, args, data_path, cache_path)
+        print('> Cache written in {:.2f}s'.format(time.time() - t1))
+    synthetic = {'Arguments': vars(args), 'Frequencies': frequencies}
+    with open('{}/synthetic.json'.format(info_path), 'w') as f:
+        f.write(json.dumps(synthetic, indent=2))
+
+
+if __name__ == '__main__':
+    main()
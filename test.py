@@ -12,118 +12,249 @@
 
 import torch
 import numpy as np
-import data_processing as dp
+from utils.dataset_cache import CachedDatasetReader
 import argparse
 import json
-from models.AutoEncoder import AutoEncoder
+import os
+from models.registry import file_name, ModelRegistry
+from utils.streaming import SpotBuffer, RollingLoss, JSONLSink
+from utils import fft_segmentation
+from utils.precision import autocast, tag, compare
 
 data_path = './data/data_processed'
+cache_path = './data/cache'
 info_path = './data/info'
 save_path = './results'
 
 device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+registry = ModelRegistry(device=device)
+
+
+def load_testset(args, dataset):
+    white_noise = CachedDatasetReader(white_noise=dataset,
+                                      data_path=data_path,
+                                      cache_path=cache_path,
+                                      data_source=args.data_source,
+                                      len_seg=args.len_seg
+                                      )
+    _, testset = white_noise(args.net_name)
+    return testset
 
 
 class DamageDetection:
 
-    def __init__(self, args):
+    def __init__(self, args, testset=None):
         self.args = args
         torch.manual_seed(self.args.seed)
         np.random.seed(self.args.seed)
-        print('{} detection...'.format(args.dataset))
-        white_noise = dp.DatasetReader(white_noise=self.args.dataset,
-                                       data_path=data_path,
-                                       data_source=args.data_source,
-                                       len_seg=self.args.len_seg
-                                       )
-        _, self.testset = white_noise(args.net_name)
+        self._testset = testset
         self.spots = np.load('{}/spots.npy'.format(info_path))
-        self.AE = AutoEncoder(args)
-        self.latent = np.load('{}/features/{}.npy'.format(save_path, self.file_name()))
+        self.AE = None
+        self.device = torch.device('cpu') if args.precision == 'int8' else device
+        self._latent = None
 
     def __call__(self, *args, **kwargs):
         self.test()
 
+    @property
+    def testset(self):
+        # Read on first use, streaming detection never needs it
+        if self._testset is None:
+            self._testset = load_testset(self.args, self.args.dataset)
+        return self._testset
+
+    @property
+    def latent(self):
+        if self._latent is None:
+            self._latent = np.load('{}/features/{}.npy'.format(save_path, self.file_name()), mmap_mode='r')
+        return self._latent
+
     def file_name(self):
-        if self.args.net_name == 'MLP':
-            return '{}_{}_{}_{}_{}_{}'.format(self.args.model_name,
-                                              self.args.net_name,
-                                              self.args.len_seg,
-                                              self.args.optimizer,
-                                              self.args.learning_rate,
-                                              self.args.num_epoch
-                                              )
-        else:
-            return '{}_{}_{}_{}_{}_{}_{}'.format(self.args.model_name,
-                                                 self.args.net_name,
-                                                 self.args.len_seg,
-                                                 self.args.optimizer,
-                                                 self.args.learning_rate,
-                                                 self.args.num_epoch,
-                                                 self.args.num_hidden_map
-                                                 )
+        return file_name(self.args)
 
     def damage_index(self, err):
         return 1 - np.exp(- self.args.alpha * err)
 
-    def test(self):
-        path = '{}/models/{}/{}.model'.format(save_path,
-                                              self.args.model_name,
-                                              self.file_name()
-                                              )
-        self.AE.load_state_dict(torch.load(path, map_location=torch.device(device)))  # Load AutoEncoder
-        self.AE.eval()
-        damage_indices = {}
-        size_0 = self.testset.size(0)
-        size_1 = self.testset.size(1)
-        if self.args.net_name == 'MLP':
-            if self.args.model_name == 'VAE':
-                feats = torch.zeros(size_0 * size_1, int(self.args.dim_feature / 2))
-            else:
-                feats = torch.zeros(size_0 * size_1, int(self.args.dim_feature))
+    def load_model(self):
+        if self.args.precision == 'int8':
+            self.AE = registry.get(self.args, 'AE_int8')  # Load the quantize.py artifact
         else:
-            feats = torch.zeros(size_0 * size_1, self.args.num_hidden_map * 8)
-        idx = 0
+            self.AE = registry.get(self.args)  # Load AutoEncoder, eval() mode
+
+    def forward_losses(self, x):
+        """
+        Per-segment reconstruction and latent losses and flattened latents
+        """
+        x = x.to(self.device)
+        if self.args.net_name == 'Conv2D': x = x.unsqueeze(2)
+        with autocast(self.args.precision, self.device):
+            x_hat, z, z_hat = self.AE(x)
+        # Losses in fp32 whatever precision the forward pass ran at
+        x_hat = x_hat.float()
+        z = z.float().reshape(x.size(0), -1)
+        z_hat = z_hat.float().reshape(x.size(0), -1)
+        loss_x = ((x - x_hat) ** 2).reshape(x.size(0), -1).mean(1)  # Reconstruction loss
+        loss_z = ((z - z_hat) ** 2).mean(1)  # Latent loss
+        return loss_x, loss_z, z
+
+    def score_segments(self, testset):
+        """
+        Score the segments of all spots in fixed-size micro-batches, the
+        per-spot means are reduced over the segment owners with index_add_
+        :param testset: [num_spots, num_seg, ...]
+        :return: per-spot reconstruction loss, latent loss and the latents
+        """
+        num_spots, num_seg = testset.size(0), testset.size(1)
+        segments = testset.reshape(num_spots * num_seg, *testset.shape[2:])
+        owners = torch.arange(num_spots).repeat_interleave(num_seg)
+        sums_x = torch.zeros(num_spots, dtype=torch.float64)
+        sums_z = torch.zeros(num_spots, dtype=torch.float64)
+        feats = None
         with torch.no_grad():
-            for i, spot in enumerate(self.spots):
-                damage_indices[spot] = {}
-                x = self.testset[i]
-                x_size = x.size(0)
-                # z_w1 = self.latent[idx: idx + x_size]
-                if self.args.net_name == 'Conv2D': x = x.unsqueeze(2)
-                x_hat, z, z_hat = self.AE(x)
-                if self.args.net_name == 'Conv2D':  # Flatten
-                    z = z.reshape(x_size, -1)
-                    z_hat = z_hat.reshape(x_size, -1)
-                feats[idx: idx + x_size] = z  # Latent
-                loss_x = ((x - x_hat) ** 2).mean()  # Reconstruction loss
-                loss_z = ((z - z_hat) ** 2).mean()  # Latent loss
-                loss = self.args.beta * loss_x.item() + (1 - self.args.beta) * loss_z.item()  # Overall loss
-                damage_index = self.damage_index(loss)
-                damage_indices[spot]['Reconstruction loss'] = loss_x.item()
-                damage_indices[spot]['Latent loss'] = loss_z.item()
-                damage_indices[spot]['Damage index'] = damage_index
-                print('\033[1;32m[{}]\033[0m\t'
-                      '\033[1;31mReconstruction loss: {:5f}\033[0m\t'
-                      '\033[1;33mLatent loss: {:5f}\033[0m\t'
-                      '\033[1;34mLoss: {:5f}\033[0m\t'
-                      '\033[1;35mDamage index: {:5f}\033[0m'.
-                      format(spot, loss_x.item(), loss_z.item(),
-                             loss, damage_index)
-                      )
-                idx += x_size
-        damage_indices = json.dumps(damage_indices, indent=2)
-        with open('{}/damage index/{}_{}.json'.format(save_path,
-                                                      self.args.dataset,
-                                                      self.file_name()
-                                                      ), 'w') as f:
-            f.write(damage_indices)
-        np.save('{}/features/test/{}_{}.npy'.
-                format(save_path, self.args.dataset, self.file_name()), feats
+            for start in range(0, segments.size(0), self.args.eval_batch_size):
+                x = segments[start: start + self.args.eval_batch_size]
+                loss_x, loss_z, z = self.forward_losses(x)
+                if feats is None: feats = torch.zeros(segments.size(0), z.size(1))
+                feats[start: start + x.size(0)] = z.cpu()  # Latent
+                owner = owners[start: start + x.size(0)]
+                sums_x.index_add_(0, owner, loss_x.cpu().double())
+                sums_z.index_add_(0, owner, loss_z.cpu().double())
+        counts = torch.bincount(owners, minlength=num_spots)
+        return sums_x / counts, sums_z / counts, feats
+
+    def test(self):
+        self.load_model()
+        self.detect(self.args.dataset, self.testset)
+
+    def detect(self, dataset, testset):
+        """
+        Score one dataset with the loaded model and write its damage indices
+        and test features
+        """
+        print('{} detection...'.format(dataset))
+        damage_indices = {}
+        losses_x, losses_z, feats = self.score_segments(testset)
+        for spot, loss_x, loss_z in zip(self.spots, losses_x.tolist(), losses_z.tolist()):
+            loss = self.args.beta * loss_x + (1 - self.args.beta) * loss_z  # Overall loss
+            damage_index = self.damage_index(loss)
+            damage_indices[spot] = {}
+            damage_indices[spot]['Reconstruction loss'] = loss_x
+            damage_indices[spot]['Latent loss'] = loss_z
+            damage_indices[spot]['Damage index'] = damage_index
+            print('\033[1;32m[{}]\033[0m\t'
+                  '\033[1;31mReconstruction loss: {:5f}\033[0m\t'
+                  '\033[1;33mLatent loss: {:5f}\033[0m\t'
+                  '\033[1;34mLoss: {:5f}\033[0m\t'
+                  '\033[1;35mDamage index: {:5f}\033[0m'.
+                  format(spot, loss_x, loss_z, loss, damage_index)
+                  )
+        with open('{}/damage index/{}_{}{}.json'.format(save_path,
+                                                        dataset,
+                                                        self.file_name(),
+                                                        tag(self.args.precision)
+                                                        ), 'w') as f:
+            f.write(json.dumps(damage_indices, indent=2))
+        np.save('{}/features/test/{}_{}{}.npy'.
+                format(save_path, dataset, self.file_name(), tag(self.args.precision)), feats
                 )
+        if self.args.precision != 'fp32':
+            self.accuracy_report(dataset, damage_indices)
 
+    def accuracy_report(self, dataset, damage_indices):
+        """
+        Compare the damage indices with those of the fp32 run of the same
+        model, written next to them as {dataset}_{file}_{precision}_report.json
+        """
+        path = '{}/damage index/{}_{}.json'.format(save_path, dataset, self.file_name())
+        if not os.path.exists(path):
+            print('> No fp32 damage indices at {}, run without --precision first'.format(path))
+            return
+        with open(path) as f:
+            report = compare(json.load(f), damage_indices)
+        for key, accuracy in report.items():
+            print('\033[1;36m{} vs fp32 {}: max abs error {:5e}, mean abs error {:5e}, same ranking: {}\033[0m'.
+                  format(self.args.precision, key, accuracy['Max abs error'], accuracy['Mean abs error'],
+                         accuracy['Same ranking']))
+        with open('{}/damage index/{}_{}{}_report.json'.format(save_path,
+                                                               dataset,
+                                                               self.file_name(),
+                                                               tag(self.args.precision)
+                                                               ), 'w') as f:
+            f.write(json.dumps(report, indent=2))
 
-def main():
+
+class StreamingDamageDetection(DamageDetection):
+    """
+    Online detection: acceleration chunks are segmented and scored as they
+    arrive, a record with the rolling losses of the spot is emitted per chunk
+    """
+
+    def __init__(self, args):
+        super(StreamingDamageDetection, self).__init__(args)
+        print('{} streaming detection...'.format(args.dataset))
+        self.load_model()
+        self.buffers = {}
+        self.rolling = {}
+
+    def __call__(self, chunks, sink):
+        self.stream(chunks, sink)
+
+    def score(self, x):
+        with torch.no_grad():
+            loss_x, loss_z, _ = self.forward_losses(torch.from_numpy(x))
+        return loss_x.cpu().numpy(), loss_z.cpu().numpy()
+
+    def stream(self, chunks, sink):
+        """
+        :param chunks: iterable of (spot, chunk), chunk is [num_channels, num_samples]
+        :param sink: callable receiving one dict per scored chunk, e.g. JSONLSink
+        """
+        for spot, chunk in chunks:
+            if spot not in self.buffers:
+                self.buffers[spot] = SpotBuffer(self.args.len_seg, self.args.step,
+                                                dc=self.args.spectra_dc, scale=self.args.spectra_scale)
+                self.rolling[spot] = RollingLoss(self.args.window)
+            x = self.buffers[spot].push(chunk, self.args.net_name)
+            if x is None:
+                continue
+            loss_x, loss_z = self.rolling[spot].update(*self.score(x))
+            loss = self.args.beta * loss_x + (1 - self.args.beta) * loss_z  # Overall loss
+            sink({'Spot': str(spot),
+                  'Segments': self.rolling[spot].num_seg,
+                  'Reconstruction loss': loss_x,
+                  'Latent loss': loss_z,
+                  'Damage index': self.damage_index(loss)
+                  })
+
+
+def check_spectra(args, tolerance=1e-4):
+    """
+    Compare the streaming spectra of the record at args.stream with the
+    cached DatasetReader testset of args.dataset, which must have been read
+    from that record, and stop if the chosen dc/scale do not reproduce it
+    """
+    records = np.load(args.stream, mmap_mode='r')
+    errors = fft_segmentation.check(records, load_testset(args, args.dataset), args.len_seg, args.net_name)
+    for (dc, scale), error in sorted(errors.items(), key=lambda item: item[1]):
+        print('>>> dc {}, scale {}: max abs error {:5e}'.format(dc, scale, error))
+    if errors[(args.spectra_dc, args.spectra_scale)] > tolerance:
+        dc, scale = min(errors, key=errors.get)
+        raise SystemExit('Streaming spectra differ from the {} testset, closest setting: {}--spectra_scale {}'.
+                         format(args.dataset, '--spectra_dc ' if dc else '', scale))
+
+
+def replay_records(path, spots, chunk_size):
+    """
+    Feed a recorded [num_spots, num_channels, num_samples] file in chunks,
+    interleaved across spots as a live acquisition would deliver them
+    """
+    records = np.load(path, mmap_mode='r')
+    for start in range(0, records.shape[-1], chunk_size):
+        for i, spot in enumerate(spots):
+            yield spot, records[i, :, start: start + chunk_size]
+
+
+def get_parser():
     # Hyper-parameters
     parser = argparse.ArgumentParser()
     parser.add_argument('--dataset', default='WN2', type=str)
@@ -145,9 +276,38 @@ def main():
     parser.add_argument('--learning_rate', default=1e-4, type=float)
     parser.add_argument('--alpha', default=1.0, type=float)
     parser.add_argument('--beta', default=0.5, type=float)
-    args = parser.parse_args()
-    detector = DamageDetection(args)
-    detector()
+    parser.add_argument('--eval_batch_size', default=1024, type=int)
+    # fp32, bf16 autocast of the forward pass, or the int8 model written by quantize.py (MLP)
+    parser.add_argument('--precision', default='fp32', type=str)
+    # Precision the model was trained at (train.py --precision), selects its checkpoint
+    parser.add_argument('--train_precision', default='fp32', type=str)
+    # Streaming setting
+    parser.add_argument('--stream', default=None, type=str)
+    parser.add_argument('--chunk_size', default=1000, type=int)
+    parser.add_argument('--step', default=None, type=int)
+    parser.add_argument('--window', default=50, type=int)
+    # Spectra normalization of the streamed windows, must match the one DatasetReader trained on
+    parser.add_argument('--spectra_dc', action='store_true')
+    parser.add_argument('--spectra_scale', default='channel', type=str)
+    # Check that normalization against the cached testset of --dataset, read from the --stream record
+    parser.add_argument('--check_spectra', action='store_true')
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    if args.stream is None:
+        detector = DamageDetection(args)
+        detector()
+    else:
+        if args.check_spectra: check_spectra(args)
+        detector = StreamingDamageDetection(args)
+        sink = JSONLSink('{}/damage index/{}_{}_stream.jsonl'.format(save_path,
+                                                                    args.dataset,
+                                                                    detector.file_name()
+                                                                    ))
+        detector(replay_records(args.stream, detector.spots, args.chunk_size), sink)
+        sink.close()
 
 
 if __name__ == '__main__':
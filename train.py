@@ -11,55 +11,90 @@
 """
 
 
+import os
 import torch
-from torch.utils.data import DataLoader
 from torch import nn, optim
 from adabelief_pytorch import AdaBelief
 import numpy as np
-import matplotlib.pyplot as plt
-import data_processing as dp
+from utils.dataset_cache import CachedDatasetReader
+from utils.batching import TensorBatches
+from utils.reporter import AsyncReporter
+from utils.checkpoint import AsyncCheckpointer, rng_state, set_rng_state, load
+from utils.convergence import ConvergenceController
+from utils.precision import autocast
+from utils.compile import CompiledStep, eager
+from utils.metrics import make_metrics
+from utils.profiler import make_profiler, NullProfiler
 import time
 import json
 import argparse
 from models.AutoEncoder import AutoEncoder
-import visdom
+from models.registry import file_name, checkpoint_path
 
 
 data_path = './data/data_processed'
+cache_path = './data/cache'
 info_path = './data/info'
 save_path = './results'
+eval_batch_size = 1024
 
 device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
 
 
 class BaseExperiment:
 
-    def __init__(self, args):
+    def __init__(self, args, dataset=None):
+        if args.precision == 'int8':
+            raise ValueError('int8 is an inference precision, quantize a trained model with quantize.py')
+        # Names the checkpoint, latents and history, so a bf16 run leaves the fp32 ones alone
+        args.train_precision = args.precision
         self.args = args
         torch.manual_seed(self.args.seed)
         np.random.seed(self.args.seed)
         print('> Training arguments:')
         for arg in vars(args):
             print('>>> {}: {}'.format(arg, getattr(args, arg)))
-        white_noise = dp.DatasetReader(white_noise=self.args.dataset,
-                                       data_path=data_path,
-                                       data_source=args.data_source,
-                                       len_seg=self.args.len_seg
-                                       )
-        dataset, _ = white_noise(args.net_name)
-        self.data_loader = DataLoader(dataset=dataset,
-                                      batch_size=args.batch_size,
-                                      shuffle=False
-                                      )
+        if dataset is None:
+            white_noise = CachedDatasetReader(white_noise=self.args.dataset,
+                                              data_path=data_path,
+                                              cache_path=cache_path,
+                                              data_source=args.data_source,
+                                              len_seg=self.args.len_seg
+                                              )
+            dataset, _ = white_noise(args.net_name)
+        unsqueeze = 2 if args.net_name == 'Conv2D' else None
+        self.dataset = dataset  # Full set, indexed by spot for the reconstruction plots
+        self.holdout_loader = None
+        if args.holdout > 0:
+            idx = torch.randperm(dataset.size(0))
+            num_holdout = int(args.holdout * dataset.size(0))
+            self.holdout_loader = TensorBatches(dataset=dataset[idx[:num_holdout].sort()[0]],
+                                                batch_size=eval_batch_size,
+                                                unsqueeze=unsqueeze
+                                                )
+            dataset = dataset[idx[num_holdout:].sort()[0]]
+        self.data_loader = TensorBatches(dataset=dataset,
+                                         batch_size=args.batch_size,
+                                         shuffle=False,
+                                         unsqueeze=unsqueeze
+                                         )
         self.spots = np.load('{}/spots.npy'.format(info_path))
         self.AE = AutoEncoder(args).to(device)  # AutoEncoder
         self.AE.apply(self.weights_init)
         self.criterion = nn.MSELoss()
-        self.vis = visdom.Visdom(env='{}'.format(self.file_name()),
-                                 log_to_filename='{}/visualization/{}.log'.
-                                 format(save_path, self.file_name())
-                                 )
-        plt.figure(figsize=(15, 15))
+        # Sink calls only happen on the reporter thread, never in the training loop
+        self.metrics = make_metrics(args.metrics, self.file_name(), save_path, resume=args.resume)
+        self.pending_losses = []
+        self.reporter = AsyncReporter(self.render,
+                                      interval=args.vis_interval,
+                                      coalesce=self.coalesce
+                                      )
+        self.profiler = make_profiler(args.profile, args.profile_epochs,
+                                      trace_path='{}/profiles/{}.json'.format(save_path, self.file_name()),
+                                      sync=device.type == 'cuda'
+                                      )
+        # Timers inside a compiled step would break its graph, --compile only times the whole step
+        self.step_profiler = NullProfiler() if args.compile else self.profiler
 
     def select_optimizer(self, model):
         if self.args.optimizer == 'Adam':
@@ -70,7 +105,9 @@ class BaseExperiment:
         elif self.args.optimizer == 'AdaBelief':
             optimizer = AdaBelief(model.parameters(),
                                   lr=self.args.learning_rate,
-                                  betas=(0.5, 0.999)
+                                  betas=(0.5, 0.999),
+                                  state_precision=self.args.state_precision,
+                                  foreach=True if self.args.foreach else None
                                   )
         elif self.args.optimizer == 'RMS':
             optimizer = optim.RMSprop(filter(lambda p: p.requires_grad, model.parameters()),
@@ -105,140 +142,252 @@ class BaseExperiment:
             nn.init.normal_(m.weight.data, 0.0, 0.02)
 
     def file_name(self):
-        if self.args.net_name == 'MLP':
-          return '{}_{}_{}_{}_{}_{}'.format(self.args.model_name,
-                                            self.args.net_name,
-                                            self.args.len_seg,
-                                            self.args.optimizer,
-                                            self.args.learning_rate,
-                                            self.args.num_epoch
-                                            )
+        return file_name(self.args)
+
+    def checkpoint_path(self):
+        return '{}/checkpoints/{}.ckpt'.format(save_path, self.file_name())
+
+    def holdout_loss(self):
+        self.AE.eval()
+        loss, num_samples = 0., 0
+        with torch.no_grad():
+            for sample_batched in self.holdout_loader:
+                x = sample_batched.to(device)
+                with autocast(self.args.precision, device):
+                    x_hat, z, z_hat = self.AE(x)
+                mse_x = self.criterion(x_hat.float(), x)
+                mse_z = self.criterion(z_hat.float(), z.float())
+                loss += (self.args.beta * mse_x + (1 - self.args.beta) * mse_z).item() * x.size(0)
+                num_samples += x.size(0)
+        self.AE.train()
+        return loss / num_samples
+
+    def capture_latents(self):
+        """
+        Stream the latents of the full dataset, holdout rows included and in
+        their original order, into the feature file with a separate no_grad
+        eval() pass, only run on improving epochs so the training step never
+        keeps a graph-carrying latent buffer alive
+        """
+        path = '{}/features/{}.npy'.format(save_path, self.file_name())
+        tmp = '{}/features/{}.{}.tmp.npy'.format(save_path, self.file_name(), os.getpid())
+        features = None
+        idx = 0
+        self.AE.eval()
+        with torch.no_grad():
+            for sample_batched in TensorBatches(dataset=self.dataset,
+                                                batch_size=eval_batch_size,
+                                                unsqueeze=2 if self.args.net_name == 'Conv2D' else None
+                                                ):
+                with autocast(self.args.precision, device):
+                    z = self.AE(sample_batched.to(device))[1].float()
+                if features is None:
+                    features = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32,
+                                                         shape=(len(self.dataset), ) + tuple(z.shape[1:])
+                                                         )
+                features[idx: idx + z.size(0)] = z.cpu().numpy()
+                idx += z.size(0)
+        self.AE.train()
+        features.flush()
+        del features
+        os.replace(tmp, path)
+
+    def train_step(self, x, optimizer):
+        """
+        Forward (and so backward) under autocast with the losses in fp32, then
+        the optimizer update, of one batch. The unit compiled by --compile.
+        Phases are laps, a graph break inside a with block cannot be resumed
+        """
+        self.step_profiler.mark()
+        if self.args.model_name == 'VAE':
+            with autocast(self.args.precision, device):
+                x_hat, z, z_kld = self.AE(x)
+            loss = self.criterion(x_hat.float(), x)
+            elbo = - loss - 1.0 * z_kld.float()
+            loss = - elbo
+            outputs = (z_kld.detach(), )
         else:
-          return '{}_{}_{}_{}_{}_{}_{}'.format(self.args.model_name,
-                                               self.args.net_name,
-                                               self.args.len_seg,
-                                               self.args.optimizer,
-                                               self.args.learning_rate,
-                                               self.args.num_epoch,
-                                               self.args.num_hidden_map
-                                               )
+            with autocast(self.args.precision, device):
+                x_hat, z, z_hat = self.AE(x)
+            mse_x = self.criterion(x_hat.float(), x)
+            mse_z = self.criterion(z_hat.float(), z.float())
+            loss = self.args.beta * mse_x + (1 - self.args.beta) * mse_z
+            outputs = (mse_x.detach(), mse_z.detach())
+        self.step_profiler.lap('forward')
+        optimizer.zero_grad()
+        loss.backward()
+        self.step_profiler.lap('backward')
+        optimizer.step()
+        self.step_profiler.lap('optimizer')
+        return (loss.detach(), ) + outputs
 
     def train(self):
         optimizer = self.select_optimizer(self.AE)
+        if self.args.compile and isinstance(optimizer, AdaBelief):
+            # Its per-parameter int step counters would recompile the update every step
+            optimizer.step = eager(optimizer.step)
+        step = CompiledStep(self.train_step, compile=self.args.compile)
+        checkpointer = AsyncCheckpointer()
+        controller = ConvergenceController(optimizer,
+                                           monitor='train' if self.holdout_loader is None else 'holdout',
+                                           patience=self.args.patience,
+                                           lr_patience=self.args.lr_patience,
+                                           lr_factor=self.args.lr_factor,
+                                           min_lr=self.args.min_lr,
+                                           smoothing=self.args.smoothing,
+                                           min_delta=self.args.min_delta
+                                           )
+        start_epoch = 0
         best_loss = 100.
         best_epoch = 1
         lh = {}
-        losses, mses_x, mses_z = [], [], []
-        for epoch in range(self.args.num_epoch):
-            t0 = time.time()
-            if self.args.net_name == 'MLP':
+        losses, mses_x, mses_z, monitored_losses = [], [], [], []
+        if self.args.resume:
+            state = load(self.checkpoint_path())
+            self.AE.load_state_dict(state['model'])
+            optimizer.load_state_dict(state['optimizer'])
+            start_epoch = state['epoch']
+            best_loss, best_epoch = state['best_loss'], state['best_epoch']
+            losses, mses_x, mses_z = state['losses'], state['mses_x'], state['mses_z']
+            monitored_losses = state['monitored_losses']
+            controller.load_state_dict(state['controller'])
+            set_rng_state(state['rng'])
+            print('> Resuming from epoch {}'.format(start_epoch + 1))
+        for epoch in range(start_epoch, self.args.num_epoch):
+            with self.profiler.epoch(epoch):
+                t0 = time.time()
+                idx = 0
+                epoch_loss = 0.
+                for _, sample_batched in enumerate(self.profiler.iterate('data', self.data_loader)):
+                    batch_size = sample_batched.size(0)
+                    with self.profiler.phase('step'):
+                        x = sample_batched.to(device)
+                        if self.args.model_name == 'VAE':
+                            loss, z_kld = step(x, optimizer)
+                        else:
+                            loss, mse_x, mse_z = step(x, optimizer)
+                    epoch_loss += loss * batch_size
+                    idx += batch_size
+                t1 = time.time()
                 if self.args.model_name == 'VAE':
-                    f = torch.zeros(len(self.data_loader.dataset), int(self.args.dim_feature / 2))
+                    print('\033[1;31mEpoch: {}\033[0m\t'
+                          '\033[1;32mReconstruction loss: {:5f}\033[0m\t'
+                          '\033[1;33mKL Divergence: {:5f}\033[0m\t'
+                          '\033[1;35mTime cost: {:2f}s\033[0m'
+                          .format(epoch + 1, loss.item(), z_kld, t1 - t0))
                 else:
-                    f = torch.zeros(len(self.data_loader.dataset), int(self.args.dim_feature))
-            else:
-                f = torch.zeros(len(self.data_loader.dataset), self.args.num_hidden_map, 1, 8)
-            idx = 0
-            for _, sample_batched in enumerate(self.data_loader):
-                batch_size = sample_batched.size(0)
-                x = sample_batched.to(device)
-                if self.args.net_name == 'Conv2D': x = x.unsqueeze(2)
-                if self.args.model_name == 'VAE':
-                    x_hat, z, z_kld = self.AE(x)
-                    loss = self.criterion(x_hat, x)
-                    elbo = - loss - 1.0 * z_kld
-                    loss = - elbo
+                    print('\033[1;31mEpoch: {}\033[0m\t'
+                          '\033[1;32mLoss: {:5f}\033[0m\t'
+                          '\033[1;33mMSE: {:5f}\033[0m\t'
+                          '\033[1;34mMSE_latent: {:5f}\033[0m\t'
+                          '\033[1;35mTime cost: {:2f}s\033[0m'
+                          .format(epoch + 1, loss.item(), mse_x.item(), mse_z.item(), t1 - t0))
+                if loss.item() < best_loss:
+                    best_loss = loss.item()
+                    best_epoch = epoch + 1
+                    with self.profiler.phase('checkpoint'):
+                        checkpointer.save(self.AE.state_dict(), checkpoint_path(self.args))
+                    with self.profiler.phase('latents'):
+                        self.capture_latents()
+                losses.append(loss.item())
+                mses_x.append(mse_x.item())
+                mses_z.append(mse_z.item())
+                if self.holdout_loader is None:
+                    monitored_losses.append(epoch_loss.item() / idx)
                 else:
-                    x_hat, z, z_hat = self.AE(x)
-                    mse_x = self.criterion(x_hat, x)
-                    mse_z = self.criterion(z_hat, z)
-                    loss = self.args.beta * mse_x + (1 - self.args.beta) * mse_z
-                    loss = loss
-                f[idx: idx + batch_size] = z
-                optimizer.zero_grad()
-                loss.backward()
-                optimizer.step()
-                idx += batch_size
-            t1 = time.time()
-            if self.args.model_name == 'VAE':
-                print('\033[1;31mEpoch: {}\033[0m\t'
-                      '\033[1;32mReconstruction loss: {:5f}\033[0m\t'
-                      '\033[1;33mKL Divergence: {:5f}\033[0m\t'
-                      '\033[1;35mTime cost: {:2f}s\033[0m'
-                      .format(epoch + 1, loss.item(), z_kld, t1 - t0))
-            else:
-                print('\033[1;31mEpoch: {}\033[0m\t'
-                      '\033[1;32mLoss: {:5f}\033[0m\t'
-                      '\033[1;33mMSE: {:5f}\033[0m\t'
-                      '\033[1;34mMSE_latent: {:5f}\033[0m\t'
-                      '\033[1;35mTime cost: {:2f}s\033[0m'
-                      .format(epoch + 1, loss.item(), mse_x.item(), mse_z.item(), t1 - t0))
-            if loss.item() < best_loss:
-                best_loss = loss.item()
-                best_epoch = epoch + 1
-                f = f.detach().numpy()
-                path = '{}/models/{}/{}.model'.format(save_path,
-                                                      self.args.model_name,
-                                                      self.file_name()
-                                                      )
-                torch.save(self.AE.state_dict(), path)
-                np.save('{}/features/{}.npy'.format(save_path, self.file_name()), f)
-            losses.append(loss.item())
-            mses_x.append(mse_x.item())
-            mses_z.append(mse_z.item())
-            self.show_loss(loss, epoch)
-            self.show_reconstruction(epoch)
-        plt.close()
+                    with self.profiler.phase('holdout'):
+                        monitored_losses.append(self.holdout_loss())
+                stop = controller.step(monitored_losses[-1])
+                last = stop or epoch + 1 == self.args.num_epoch
+                with self.profiler.phase('report'):
+                    self.report(loss, epoch, force=last)
+                if self.args.checkpoint_every and ((epoch + 1) % self.args.checkpoint_every == 0 or last):
+                    with self.profiler.phase('checkpoint'):
+                        checkpointer.save({'epoch': epoch + 1,
+                                           'model': self.AE.state_dict(),
+                                           'optimizer': optimizer.state_dict(),
+                                           'best_loss': best_loss,
+                                           'best_epoch': best_epoch,
+                                           'losses': losses,
+                                           'mses_x': mses_x,
+                                           'mses_z': mses_z,
+                                           'monitored_losses': monitored_losses,
+                                           'controller': controller.state_dict(),
+                                           'rng': rng_state()
+                                           }, self.checkpoint_path())
+                if stop:
+                    print('> Early stopping at epoch {}: {}'.format(epoch + 1, controller.stop_reason))
+                    break
+        checkpointer.close()
+        self.reporter.close()
+        self.metrics.close()
+        self.profiler.close()
         lh['Loss'] = losses
         lh['MSE'] = mses_x
         lh['MSE latent'] = mses_z
         lh['Min loss'] = best_loss
         lh['Best epoch'] = best_epoch
+        lh['{} loss'.format(controller.monitor.capitalize())] = monitored_losses
+        lh['Learning rate'] = controller.lr()
+        lh['Stop epoch'] = len(losses)
+        lh['Stop reason'] = controller.stop_reason or 'Reached num_epoch'
+        if self.profiler.enabled:
+            lh['Profile'] = self.profiler.summary()
         lh = json.dumps(lh, indent=2)
         with open('{}/learning history/{}.json'.format(save_path, self.file_name()), 'w') as f:
             f.write(lh)
 
-    def show_loss(self, loss, epoch):
-        self.vis.line(Y=np.array([loss.item()]), X=np.array([epoch + 1]),
-                      win='Train loss',
-                      opts=dict(title='Train loss'),
-                      update='append'
-                      )
+    def report(self, loss, epoch, force=False):
+        """
+        Hand the losses and, when the reporter is due, a reconstruction
+        snapshot to the background reporter
+        """
+        if not self.metrics.enabled:
+            return
+        self.pending_losses.append((epoch + 1, loss.item()))
+        if not (force or self.reporter.due()):
+            return
+        self.reporter.submit({'epoch': epoch,
+                              'losses': self.pending_losses,
+                              'reconstruction': self.reconstruction_snapshot()
+                              })
+        self.pending_losses = []
 
-    def show_reconstruction(self, epoch, seg_idx=25):
-        plt.clf()
-        num_seg = int(self.data_loader.dataset.shape[0] / len(self.spots))
-        spots_l1, spots_l2 = np.hsplit(self.spots, 2)
-        for i, (spot_l1, spot_l2) in enumerate(zip(spots_l1, spots_l2)):
-            # L1 sensors
-            plt.subplot(int(len(self.spots) / 2), 2, 2 * i + 1)
-            x = self.data_loader.dataset[i * num_seg + seg_idx]
-            x = x.to(device)
-            plt.plot(x.view(-1).detach().cpu().numpy(), label='original')
-            plt.title('A-{}-{}'.format(spot_l1, seg_idx))
-            if self.args.net_name == 'Conv2D': x = x.unsqueeze(0).unsqueeze(2)
-            x_hat, _, _ = self.AE(x)
-            plt.plot(x_hat.view(-1).detach().cpu().numpy(), label='reconstruct')
-            plt.axvline(x=127, ls='--', c='k')
-            plt.axvline(x=255, ls='--', c='k')
-            plt.legend(loc='upper center')
-            # L2 sensors 
-            plt.subplot(int(len(self.spots) / 2), 2, 2 * (i + 1))
-            x = self.data_loader.dataset[(i + 5) * num_seg + seg_idx]
-            x = x.to(device)
-            plt.plot(x.view(-1).detach().cpu().numpy(), label='original')
-            plt.title('A-{}-{}'.format(spot_l2, seg_idx))
-            if self.args.net_name == 'Conv2D': x = x.unsqueeze(0).unsqueeze(2)
-            x_hat, _, _ = self.AE(x)
-            plt.plot(x_hat.view(-1).detach().cpu().numpy(), label='reconstruct')
-            plt.axvline(x=127, ls='--', c='k')
-            plt.axvline(x=255, ls='--', c='k')
-            plt.legend(loc='upper center')
-        plt.subplots_adjust(hspace=0.5)
-        self.vis.matplot(plt, win='Reconstruction', opts=dict(title='Epoch: {}'.format(epoch + 1)))
+    @staticmethod
+    def coalesce(old, new):
+        # Losses of a dropped snapshot are still drawn on the loss curve
+        new['losses'] = old['losses'] + new['losses']
+        return new
 
+    def render(self, snapshot):
+        # Timed on the reporter thread, off the training loop
+        with self.profiler.phase('render'):
+            epochs, losses = zip(*snapshot['losses'])
+            self.metrics.line('Train loss', epochs, losses)
+            seg_idx, x, x_hat = snapshot['reconstruction']
+            self.metrics.reconstruction(snapshot['epoch'], seg_idx, self.spots, x, x_hat)
 
-def main():
+    def reconstruction_snapshot(self, seg_idx=25):
+        """
+        One batched no_grad pass over the plotted segments, in eval() mode so
+        the BatchNorm statistics do not depend on the reporting rate
+        """
+        num_seg = int(self.dataset.shape[0] / len(self.spots))
+        num_pairs = len(self.spots) // 2
+        idx = [i * num_seg + seg_idx for i in range(len(self.spots))]
+        x = self.dataset[idx].to(device)
+        if self.args.net_name == 'Conv2D': x = x.unsqueeze(2)
+        self.AE.eval()
+        with torch.no_grad(), autocast(self.args.precision, device):
+            x_hat = self.AE(x)[0].float()
+        self.AE.train()
+        x = x.reshape(len(idx), -1).cpu().numpy()
+        x_hat = x_hat.reshape(len(idx), -1).cpu().numpy()
+        # Pairs of (L1, L2) sensors as laid out by spots.npy
+        return seg_idx, x.reshape(2, num_pairs, -1), x_hat.reshape(2, num_pairs, -1)
+
+
+def get_parser():
     # Hyper-parameters
     parser = argparse.ArgumentParser()
     parser.add_argument('--dataset', default='WN1', type=str)
@@ -247,7 +396,15 @@ def main():
     parser.add_argument('--net_name', default='MLP', type=str)
     parser.add_argument('--len_seg', default=400, type=int)
     parser.add_argument('--optimizer', default='Adam', type=str)
+    # Storage of the AdaBelief moment estimates: fp32, bf16 or int8
+    parser.add_argument('--state_precision', default='fp32', type=str)
+    # AdaBelief multi-tensor step on the CPU too, by default only groups on the GPU use it
+    parser.add_argument('--foreach', action='store_true')
     parser.add_argument('--initializer', default='xavier_normal_', type=str)
+    # fp32, or bf16 autocast of the forward/backward with fp32 master weights
+    parser.add_argument('--precision', default='fp32', type=str)
+    # torch.compile the train step, eager fallback, kernels cached under results/compile_cache
+    parser.add_argument('--compile', action='store_true')
     # MLP setting
     parser.add_argument('--dim_input', default=384, type=int)
     parser.add_argument('--dim_feature', default=20, type=int)
@@ -259,7 +416,30 @@ def main():
     parser.add_argument('--num_epoch', default=100, type=int)
     parser.add_argument('--learning_rate', default=1e-4, type=float)
     parser.add_argument('--beta', default=0.5, type=float)
-    args = parser.parse_args()
+    # Metrics sink: visdom, jsonl (results/visualization/{file}.jsonl), memory or none
+    parser.add_argument('--metrics', default='visdom', type=str)
+    # Minimum seconds between two metrics updates
+    parser.add_argument('--vis_interval', default=1.0, type=float)
+    # Phase timers, histograms in the learning history and a Chrome trace under results/profiles
+    parser.add_argument('--profile', action='store_true')
+    # Epochs (1-based) traced call by call and under torch.profiler, implies --profile
+    parser.add_argument('--profile_epochs', default=[], type=int, nargs='*')
+    # Epochs between two resumable checkpoints, 0 disables them
+    parser.add_argument('--checkpoint_every', default=100, type=int)
+    parser.add_argument('--resume', action='store_true')
+    # Convergence control, monitors the holdout loss when --holdout > 0
+    parser.add_argument('--holdout', default=0., type=float)
+    parser.add_argument('--patience', default=0, type=int)
+    parser.add_argument('--lr_patience', default=0, type=int)
+    parser.add_argument('--lr_factor', default=0.5, type=float)
+    parser.add_argument('--min_lr', default=1e-6, type=float)
+    parser.add_argument('--smoothing', default=0.9, type=float)
+    parser.add_argument('--min_delta', default=1e-6, type=float)
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
     exp = BaseExperiment(args)
     exp.train()
 
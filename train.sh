@@ -4,34 +4,16 @@ len_segs=(300 400 500)
 net_names=("MLP" "Conv2D")
 num_hidden_maps=(256 128 64 32)
 learning_rate=1e-4
-for len_seg in "${len_segs[@]}"; do
-  for net_name in "${net_names[@]}"; do
-      if [ "$net_name" == "MLP" ]; then
-          num_epoch=10000
-          printf "\033[1;32mLength of segments:\t%s\nNet name:\t%s\n\033[0m" \
-                 "$len_seg" "$net_name"
-          if [[ $sys =~ $Mac ]]; then
-              python3 train.py --model_name AE --net_name "$net_name" --len_seg "$len_seg" \
-                               --num_epoch $num_epoch --learning_rate $learning_rate
-          else
-              python train.py --model_name AE --net_name "$net_name" --len_seg "$len_seg" \
-                              --num_epoch $num_epoch --learning_rate $learning_rate
-          fi
-      else
-          num_epoch=1000
-          for num_hidden_map in "${num_hidden_maps[@]}"; do
-            printf "\033[1;32mLength of segments:\t%s\nNet name:\t%s\nNum hidden maps:\t%s\n\033[0m" \
-                   "$len_seg" "$net_name" "$num_hidden_map"
-            if [[ $sys =~ $Mac ]]; then
-               python3 train.py --model_name AE --net_name "$net_name" --len_seg "$len_seg" \
-                                --num_epoch $num_epoch --num_hidden_map "$num_hidden_map" \
-                                --learning_rate $learning_rate
-            else
-               python train.py --model_name AE --net_name "$net_name" --len_seg "$len_seg" \
-                               --num_epoch $num_epoch --num_hidden_map "$num_hidden_map" \
-                               --learning_rate $learning_rate
-            fi
-          done
-      fi
-  done
-done
+printf "\033[1;32mLength of segments:\t%s\nNet names:\t%s\nNum hidden maps:\t%s\n\033[0m" \
+       "${len_segs[*]}" "${net_names[*]}" "${num_hidden_maps[*]}"
+if [[ $sys =~ $Mac ]]; then
+    python3 sweep.py --len_segs "${len_segs[@]}" --net_names "${net_names[@]}" \
+                     --num_hidden_maps "${num_hidden_maps[@]}" \
+                     --num_epoch_mlp 10000 --num_epoch_conv 1000 \
+                     --model_name AE --learning_rate $learning_rate
+else
+    python sweep.py --len_segs "${len_segs[@]}" --net_names "${net_names[@]}" \
+                    --num_hidden_maps "${num_hidden_maps[@]}" \
+                    --num_epoch_mlp 10000 --num_epoch_conv 1000 \
+                    --model_name AE --learning_rate $learning_rate
+fi
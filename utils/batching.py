@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 20/10/26 10:10 AM
+@description: Batch iterator over an in-memory tensor
+@version: 1.0
+"""
+
+
+import torch
+
+
+class TensorBatches:
+    """
+    Drop-in for DataLoader(dataset=tensor, batch_size, shuffle) over a tensor
+    that is already in memory. Batches are contiguous slices instead of
+    per-sample __getitem__ + collate, shuffling gathers the tensor once per
+    epoch with a random permutation
+    :param unsqueeze: dim added to every sample once up front, e.g. 2 for the
+                      [b, 3, 1, 128] input of the Conv2D networks
+    """
+
+    def __init__(self, dataset, batch_size=1, shuffle=False, unsqueeze=None, generator=None):
+        self.dataset = dataset
+        self.data = dataset if unsqueeze is None else dataset.unsqueeze(unsqueeze)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.generator = generator
+
+    def __len__(self):
+        return (self.data.size(0) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        data = self.data
+        if self.shuffle:
+            data = data.index_select(0, torch.randperm(data.size(0), generator=self.generator))
+        for start in range(0, data.size(0), self.batch_size):
+            yield data[start: start + self.batch_size]
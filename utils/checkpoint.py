@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 21/10/26 10:20 AM
+@description: Atomic checkpoints written from a background thread
+@version: 1.0
+"""
+
+
+import os
+import atexit
+import random
+import threading
+from collections import OrderedDict
+import numpy as np
+import torch
+
+
+def snapshot(obj):
+    """
+    Copy of a (nested) state with every tensor cloned to the CPU, so training
+    can keep updating the live tensors while the copy is being written
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, snapshot(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return obj
+
+
+def rng_state():
+    state = {'torch': torch.get_rng_state(),
+             'numpy': np.random.get_state(),
+             'random': random.getstate()
+             }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['random'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def atomic_save(obj, path):
+    """
+    Write then rename, a crash never leaves a truncated checkpoint behind
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+def load(path):
+    # Checkpoints hold the NumPy/random RNG states, which weights_only loading rejects
+    try:
+        return torch.load(path, map_location='cpu', weights_only=False)
+    except TypeError:
+        return torch.load(path, map_location='cpu')
+
+
+class AsyncCheckpointer:
+    """
+    Saves snapshots with atomic_save on a background thread. Only the latest
+    pending snapshot per path is kept, older ones are superseded unwritten
+    """
+
+    def __init__(self):
+        self.pending = OrderedDict()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        # Flush pending snapshots even when training dies with an exception
+        atexit.register(self.close)
+
+    def save(self, obj, path):
+        obj = snapshot(obj)
+        with self.cond:
+            self.pending[path] = obj
+            self.pending.move_to_end(path)
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                path, obj = self.pending.popitem(last=False)
+            try:
+                atomic_save(obj, path)
+            except Exception as e:  # Keep training, the next checkpoint may succeed
+                print('Checkpoint {} failed: {}'.format(path, e))
+
+    def close(self):
+        """
+        Write everything still pending and stop the thread, idempotent
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+        # Drop the exit hook, it would otherwise keep this checkpointer alive
+        atexit.unregister(self.close)
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 23/10/26 10:15 AM
+@description: torch.compile of whole training steps with an eager fallback
+@version: 1.0
+"""
+
+
+import os
+import torch
+
+
+compile_cache_path = './results/compile_cache'
+
+
+def enable_cache(path=compile_cache_path):
+    """
+    Keep the inductor FX graph and AOTAutograd caches in one directory, so
+    every sweep process after the first one loads compiled kernels from disk
+    instead of compiling them again. Assigned rather than defaulted, importing
+    torch._dynamo already points the variable at a per-user temp directory
+    """
+    os.makedirs(path, exist_ok=True)
+    os.environ['TORCHINDUCTOR_CACHE_DIR'] = os.path.abspath(path)
+    os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+    os.environ.setdefault('TORCHINDUCTOR_AUTOGRAD_CACHE', '1')
+
+
+def eager(fn):
+    """
+    Keep fn out of the compiled graph, e.g. an optimizer step whose Python
+    int state would otherwise trigger a recompilation every call
+    """
+    if hasattr(torch, 'compiler') and hasattr(torch.compiler, 'disable'):
+        return torch.compiler.disable(fn)
+    return fn
+
+
+def is_compile_error(e):
+    """
+    Whether e comes from Dynamo or a compiler backend (backend failures, e.g.
+    no C++ toolchain, are wrapped in BackendCompilerFailed), rather than
+    from the step itself. Errors of the step found while tracing it, such
+    as a shape mismatch, come as TorchRuntimeError and are not compile errors
+    """
+    from torch._dynamo.exc import TorchDynamoException, TorchRuntimeError
+    return isinstance(e, TorchDynamoException) and not isinstance(e, TorchRuntimeError)
+
+
+class CompiledStep:
+    """
+    Runs step(*args) through torch.compile. Dynamo captures the forward pass
+    and the loss, AOTAutograd compiles the matching backward graph, and the
+    optimizer update is compiled as a second graph. If torch.compile is not
+    available, or compiling fails (no C++ toolchain, unsupported op), the
+    step falls back to eager for the rest of the run. Any other error of the
+    step is raised as it would be eagerly
+    """
+
+    def __init__(self, step, compile=True):
+        self.eager = step
+        self.step = step
+        if compile and hasattr(torch, 'compile'):
+            enable_cache()
+            self.step = torch.compile(step)
+        elif compile:
+            print('> torch.compile is not available, training eagerly')
+
+    @property
+    def compiled(self):
+        return self.step is not self.eager
+
+    def __call__(self, *args):
+        if not self.compiled:
+            return self.step(*args)
+        try:
+            return self.step(*args)
+        except Exception as e:  # Compilation happens on the call, before the update is applied
+            if not is_compile_error(e):
+                raise
+            print('> torch.compile failed, training eagerly: {}'.format(str(e).splitlines()[0] if str(e) else e))
+            self.step = self.eager
+            return self.step(*args)
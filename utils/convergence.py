@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 21/10/26 3:40 PM
+@description: Plateau learning rate schedule and early stopping on a smoothed loss
+@version: 1.0
+"""
+
+
+from torch import optim
+
+
+class ConvergenceController:
+    """
+    Tracks an exponentially smoothed loss once per epoch, lowers the learning
+    rate when it plateaus and asks to stop once it has not improved by more
+    than min_delta for `patience` epochs
+    :param patience: epochs without improvement before stopping, 0 never stops
+    :param lr_patience: epochs without improvement before the lr is multiplied
+                        by lr_factor, 0 keeps the lr fixed
+    :param smoothing: EMA weight of the previous smoothed loss
+    """
+
+    def __init__(self, optimizer, monitor='train', patience=0, lr_patience=0, lr_factor=0.5,
+                 min_lr=0., smoothing=0.9, min_delta=0.):
+        self.optimizer = optimizer
+        self.monitor = monitor
+        self.patience = patience
+        self.smoothing = smoothing
+        self.min_delta = min_delta
+        if lr_patience:
+            self.scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer,
+                                                                  mode='min',
+                                                                  factor=lr_factor,
+                                                                  patience=lr_patience,
+                                                                  threshold=min_delta,
+                                                                  threshold_mode='abs',
+                                                                  min_lr=min_lr
+                                                                  )
+        else:
+            self.scheduler = None
+        self.smoothed = None
+        self.best = float('inf')
+        self.bad_epochs = 0
+        self.stop_reason = None
+
+    def step(self, loss):
+        """
+        :param loss: loss of the monitored set for the epoch just finished
+        :return: True when training should stop
+        """
+        if self.smoothed is None:
+            self.smoothed = loss
+        else:
+            self.smoothed = self.smoothing * self.smoothed + (1 - self.smoothing) * loss
+        if self.scheduler is not None:
+            self.scheduler.step(self.smoothed)
+        if self.smoothed < self.best - self.min_delta:
+            self.best = self.smoothed
+            self.bad_epochs = 0
+        else:
+            self.bad_epochs += 1
+        if self.patience and self.bad_epochs >= self.patience:
+            self.stop_reason = 'Smoothed {} loss did not improve for {} epochs'.format(self.monitor, self.patience)
+            return True
+        return False
+
+    def lr(self):
+        return [group['lr'] for group in self.optimizer.param_groups]
+
+    def state_dict(self):
+        return {'smoothed': self.smoothed,
+                'best': self.best,
+                'bad_epochs': self.bad_epochs,
+                'scheduler': None if self.scheduler is None else self.scheduler.state_dict()
+                }
+
+    def load_state_dict(self, state):
+        self.smoothed = state['smoothed']
+        self.best = state['best']
+        self.bad_epochs = state['bad_epochs']
+        if self.scheduler is not None and state['scheduler'] is not None:
+            self.scheduler.load_state_dict(state['scheduler'])
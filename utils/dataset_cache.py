@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 18/10/26 9:12 AM
+@description: Memory-mapped cache of the segment arrays built by DatasetReader
+@version: 1.0
+"""
+
+
+import os
+import json
+import hashlib
+import numpy as np
+import torch
+
+
+cache_path = './data/cache'
+
+
+def fingerprint(data_path):
+    """
+    Hash of the relative path, size and modification time of every raw file
+    under data_path, any change to the raw data gives a new fingerprint
+    :param data_path: root of the processed raw data
+    """
+    entries = []
+    for root, dirs, files in os.walk(data_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            entries.append('{}:{}:{}'.format(os.path.relpath(path, data_path),
+                                             stat.st_size,
+                                             stat.st_mtime_ns
+                                             ))
+    return hashlib.sha1('\n'.join(entries).encode('utf-8')).hexdigest()
+
+
+class CachedDatasetReader:
+    """
+    Drop-in replacement for data_processing.DatasetReader. The first call for a
+    (dataset, data_source, len_seg, net_name) combination builds the segments
+    with DatasetReader and stores them as .npy files, later calls (from any
+    process) open them with np.load(mmap_mode='c') and wrap them zero-copy.
+    """
+
+    def __init__(self, cache_path=cache_path, **kwargs):
+        self.kwargs = kwargs
+        self.data_path = kwargs['data_path']
+        self.cache_path = cache_path
+        self._reader = None
+        self._fingerprint = None
+
+    def __call__(self, net_name):
+        arrays = self.cached(net_name, lambda: self.reader(net_name))
+        return arrays['train'], arrays['test']
+
+    @property
+    def dataset_(self):
+        return self.cached('raw', lambda: (self.reader.dataset_, None))['train']
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            from data_processing.dataset_reader import DatasetReader
+            self._reader = DatasetReader(**self.kwargs)
+        return self._reader
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.data_path)
+        return self._fingerprint
+
+    def entry(self, layout):
+        key = '_'.join(str(self.kwargs.get(k)) for k in ('white_noise', 'data_source', 'len_seg'))
+        return '{}/{}_{}'.format(self.cache_path, key, layout)
+
+    def cached(self, layout, build):
+        entry = self.entry(layout)
+        arrays = self.load(entry)
+        if arrays is None:
+            train, test = build()
+            self.save(entry, train=train, test=test)
+            arrays = self.load(entry)
+        return arrays
+
+    def load(self, entry):
+        try:
+            with open('{}/meta.json'.format(entry)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta['fingerprint'] != self.fingerprint:
+            return None
+        arrays = {}
+        for name, kind in meta['arrays'].items():
+            if kind is None:
+                arrays[name] = None
+                continue
+            array = np.load('{}/{}.npy'.format(entry, name), mmap_mode='c')
+            arrays[name] = torch.from_numpy(array) if kind == 'tensor' else array
+        return arrays
+
+    def save(self, entry, **arrays):
+        os.makedirs(entry, exist_ok=True)
+        meta = {'fingerprint': self.fingerprint, 'arrays': {}}
+        for name, array in arrays.items():
+            if array is None:
+                meta['arrays'][name] = None
+                continue
+            meta['arrays'][name] = 'tensor' if torch.is_tensor(array) else 'ndarray'
+            if torch.is_tensor(array): array = array.detach().cpu().numpy()
+            tmp = '{}/{}.{}.tmp.npy'.format(entry, name, os.getpid())
+            np.save(tmp, np.ascontiguousarray(array))
+            os.replace(tmp, '{}/{}.npy'.format(entry, name))
+        self.write_meta(entry, meta)
+
+    def allocate(self, entry, **shapes):
+        """
+        First half of save for arrays too large to build in memory: create
+        float32 .npy files of the given shapes, to be filled through
+        np.load(path, mmap_mode='r+') by any process, then passed to commit
+        :return: {name: temporary path}
+        """
+        os.makedirs(entry, exist_ok=True)
+        paths = {}
+        for name, shape in shapes.items():
+            paths[name] = '{}/{}.{}.tmp.npy'.format(entry, name, os.getpid())
+            np.lib.format.open_memmap(paths[name], mode='w+', dtype=np.float32, shape=tuple(shape))
+        return paths
+
+    def commit(self, entry, paths, kinds=None):
+        """
+        Second half: publish the filled arrays of allocate, names given None
+        are stored as None like in save
+        :param kinds: {name: 'tensor' or 'ndarray'}, what load hands back as
+                      save records it for what DatasetReader returned, tensor
+                      for names left out
+        """
+        kinds = kinds or {}
+        meta = {'fingerprint': self.fingerprint, 'arrays': {}}
+        for name, path in paths.items():
+            if path is None:
+                meta['arrays'][name] = None
+                continue
+            meta['arrays'][name] = kinds.get(name, 'tensor')
+            os.replace(path, '{}/{}.npy'.format(entry, name))
+        self.write_meta(entry, meta)
+
+    @staticmethod
+    def write_meta(entry, meta):
+        # meta.json is written last so a half-written entry is never picked up
+        tmp = '{}/meta.{}.tmp.json'.format(entry, os.getpid())
+        with open(tmp, 'w') as f:
+            f.write(json.dumps(meta, indent=2))
+        os.replace(tmp, '{}/meta.json'.format(entry))
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 25/10/26 9:15 AM
+@description: BatchNorm folding and .npz export of trained AutoEncoders
+@version: 1.0
+"""
+
+
+import json
+import os
+import numpy as np
+import torch
+from torch import nn
+
+
+stacks = ('encoder', 'decoder', 'encoder_')
+
+
+def fold_batchnorm(layer, bn):
+    """
+    Weight and bias of layer followed by the eval() mode BatchNorm bn, as one layer
+    :return: weight with the Conv/Linear [out, in, ...] or ConvTranspose
+             [in, out, ...] layout of layer, and bias [out]
+    """
+    weight = layer.weight.detach()
+    transposed = isinstance(layer, (nn.ConvTranspose1d, nn.ConvTranspose2d))
+    bias = torch.zeros(weight.size(1 if transposed else 0)) if layer.bias is None else layer.bias.detach()
+    if bn is None:
+        return weight.clone(), bias.clone()
+    scale = bn.weight.detach() / torch.sqrt(bn.running_var + bn.eps)
+    shape = [1] * weight.dim()
+    shape[1 if transposed else 0] = -1
+    return weight * scale.view(shape), (bias - bn.running_mean) * scale + bn.bias.detach()
+
+
+def fold_layers(stack):
+    """
+    Layers of an nn.Sequential stack of layers.AE with every BatchNorm folded
+    into the layer before it. The (1, k) Conv2d/ConvTranspose2d kernels over a
+    height of 1 are 1D convolutions and are returned as such, the already
+    folded Conv1d/ConvTranspose1d of layers.AE1D as they are
+    :return: list of {'op', ...} with op in linear, conv, deconv, leaky_relu,
+             relu, sigmoid, weights as torch tensors
+    """
+    modules = list(stack)
+    layers = []
+    for i, module in enumerate(modules):
+        bn = modules[i + 1] if i + 1 < len(modules) and isinstance(modules[i + 1], nn.BatchNorm2d) else None
+        if isinstance(module, nn.Linear):
+            weight, bias = fold_batchnorm(module, bn)
+            layers.append({'op': 'linear', 'weight': weight, 'bias': bias})
+        elif isinstance(module, (nn.Conv2d, nn.ConvTranspose2d)):
+            if module.kernel_size[0] != 1 or module.stride[0] != 1 or module.padding[0] != 0:
+                raise ValueError('Only (1, k) kernels over a height of 1 can be folded: {}'.format(module))
+            weight, bias = fold_batchnorm(module, bn)
+            layers.append({'op': 'deconv' if isinstance(module, nn.ConvTranspose2d) else 'conv',
+                           'weight': weight.squeeze(2),
+                           'bias': bias,
+                           'stride': module.stride[1],
+                           'padding': module.padding[1]
+                           })
+        elif isinstance(module, (nn.Conv1d, nn.ConvTranspose1d)):
+            weight, bias = fold_batchnorm(module, None)
+            layers.append({'op': 'deconv' if isinstance(module, nn.ConvTranspose1d) else 'conv',
+                           'weight': weight,
+                           'bias': bias,
+                           'stride': module.stride[0],
+                           'padding': module.padding[0]
+                           })
+        elif isinstance(module, nn.BatchNorm2d):
+            if i == 0 or not isinstance(modules[i - 1], (nn.Linear, nn.Conv2d, nn.ConvTranspose2d)):
+                raise ValueError('BatchNorm without a layer to fold into: {}'.format(module))
+        elif isinstance(module, nn.LeakyReLU):
+            layers.append({'op': 'leaky_relu', 'slope': module.negative_slope})
+        elif isinstance(module, nn.ReLU):
+            layers.append({'op': 'relu'})
+        elif isinstance(module, nn.Sigmoid):
+            layers.append({'op': 'sigmoid'})
+        else:
+            raise ValueError('Cannot export {}'.format(module))
+    return layers
+
+
+def export(model, path):
+    """
+    Write the folded layers of a trained models.AutoEncoder to path (.npz):
+    float32 '{stack}.{i}.weight' / '{stack}.{i}.bias' arrays, and the layer
+    list as JSON in 'spec', read by utils.numpy_runtime
+    """
+    if model.args.model_name == 'VAE':
+        raise ValueError('Only the deterministic AE can be exported')
+    net = model.AE if hasattr(model, 'AE') else model
+    spec = {'net_name': model.args.net_name, 'stacks': {}}
+    arrays = {}
+    with torch.no_grad():
+        for name in stacks:
+            spec['stacks'][name] = []
+            for i, layer in enumerate(fold_layers(getattr(net, name))):
+                for key in ('weight', 'bias'):
+                    if key in layer:
+                        arrays['{}.{}.{}'.format(name, i, key)] = layer.pop(key).cpu().numpy().astype(np.float32)
+                spec['stacks'][name].append(layer)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = '{}.{}.tmp.npz'.format(path[:-4], os.getpid())
+    np.savez(tmp, spec=np.array(json.dumps(spec)), **arrays)
+    os.replace(tmp, path)
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 18/10/26 10:05 AM
+@description: Batched FFT segmentation of multi-channel acceleration records
+@version: 1.0
+"""
+
+
+import numpy as np
+import torch
+
+
+num_bins = 128
+scales = ('channel', 'segment', 'none')
+
+
+def segment(records, len_seg, step=None):
+    """
+    Strided (zero-copy) view of the records cut into windows
+    :param records: acceleration records, [..., num_samples]
+    :param len_seg: length of each window
+    :param step: hop between windows, len_seg (no overlap) by default
+    :return: [..., num_seg, len_seg]
+    """
+    step = step or len_seg
+    windows = np.lib.stride_tricks.sliding_window_view(records, len_seg, axis=-1)
+    return windows[..., ::step, :]
+
+
+def spectra(records, len_seg, step=None, num_bins=num_bins, dc=False, scale='channel'):
+    """
+    Amplitude spectra of every window in one batched rfft, the lowest
+    num_bins bins scaled to [0, 1] to match the Sigmoid output of the
+    decoders. DatasetReader lives outside this repository and its exact
+    normalization is not known here, the defaults (DC bin dropped, each
+    channel scaled by its own maximum) are an assumption that check()
+    verifies against its testset on a real record
+    :param records: [num_spots, num_channels, num_samples]
+    :param dc: keep the DC bin as the first bin instead of dropping it
+    :param scale: channel (each channel by its maximum), segment (all
+                  channels of a window by their joint maximum) or none
+    :return: [num_spots, num_channels, num_seg, num_bins]
+    """
+    if scale not in scales:
+        raise ValueError('Unknown spectra scale: {}'.format(scale))
+    if len_seg // 2 < num_bins:
+        raise ValueError('len_seg {} is too short for {} frequency bins'.format(len_seg, num_bins))
+    windows = segment(np.asarray(records, dtype=np.float32), len_seg, step)
+    first = 0 if dc else 1
+    amplitude = np.abs(np.fft.rfft(windows, axis=-1)[..., first: first + num_bins]).astype(np.float32)
+    if scale == 'channel':
+        amplitude /= np.maximum(amplitude.max(axis=-1, keepdims=True), np.finfo(np.float32).tiny)
+    elif scale == 'segment':
+        amplitude /= np.maximum(amplitude.max(axis=(1, 3), keepdims=True), np.finfo(np.float32).tiny)
+    return amplitude
+
+
+def layout(amplitude, net_name):
+    """
+    Arrange the spectra as the DatasetReader test set
+    :param amplitude: [num_spots, num_channels, num_seg, num_bins]
+    :return: [num_spots, num_seg, num_channels * num_bins] for MLP,
+             [num_spots, num_seg, num_channels, num_bins] for Conv2D
+    """
+    x = np.moveaxis(amplitude, 2, 1)
+    if net_name == 'MLP': x = x.reshape(x.shape[0], x.shape[1], -1)
+    return np.ascontiguousarray(x)
+
+
+def build(records, len_segs, net_names=('MLP', 'Conv2D'), step=None):
+    """
+    Train and test sets for several segment lengths and layouts from a single
+    read of the records, the train set is the spot-major flattening of the
+    test set as indexed by show_reconstruction
+    :param records: [num_spots, num_channels, num_samples]
+    :param len_segs: e.g. (300, 400, 500) as swept in train.sh
+    :return: {(len_seg, net_name): (dataset, testset)}
+    """
+    records = np.asarray(records, dtype=np.float32)
+    datasets = {}
+    for len_seg in len_segs:
+        amplitude = spectra(records, len_seg, step=step)
+        for net_name in net_names:
+            testset = torch.from_numpy(layout(amplitude, net_name))
+            datasets[(len_seg, net_name)] = (testset.reshape(-1, *testset.shape[2:]), testset)
+    return datasets
+
+
+def check(records, testset, len_seg, net_name, step=None):
+    """
+    Largest deviation of spectra() from the DatasetReader testset built from
+    the same records, for every dc/scale setting, to confirm the default one
+    (or find the one to use) before streaming or caching spectra
+    :param records: [num_spots, num_channels, num_samples] the testset was read from
+    :param testset: [num_spots, num_seg, ...] from DatasetReader(...)(net_name)
+    :return: {(dc, scale): max abs error}, over the segments both have
+    """
+    testset = np.asarray(testset, dtype=np.float32)
+    errors = {}
+    for dc in (False, True):
+        for scale in scales:
+            x = layout(spectra(records, len_seg, step=step, dc=dc, scale=scale), net_name)
+            num_seg = min(x.shape[1], testset.shape[1])
+            errors[(dc, scale)] = float(np.abs(x[:, :num_seg] - testset[:, :num_seg]).max())
+    return errors
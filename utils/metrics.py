@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 26/10/26 9:20 AM
+@description: Training metrics sinks: visdom, JSONL file, in-memory and no-op
+@version: 1.0
+"""
+
+
+import json
+import numpy as np
+
+
+class NullMetrics:
+    """
+    Discards everything, BaseExperiment does not even take snapshots for it
+    """
+    enabled = False
+
+    def line(self, win, epochs, values):
+        pass
+
+    def reconstruction(self, epoch, seg_idx, spots, x, x_hat):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryMetrics(NullMetrics):
+    """
+    Keeps the records in a list, in the JSONL layout
+    """
+    enabled = True
+
+    def __init__(self):
+        self.records = []
+
+    def line(self, win, epochs, values):
+        self.records.append({'type': 'line', 'win': win, 'X': list(epochs), 'Y': list(values)})
+
+    def reconstruction(self, epoch, seg_idx, spots, x, x_hat):
+        self.records.append({'type': 'reconstruction',
+                             'epoch': epoch,
+                             'seg_idx': seg_idx,
+                             'spots': [str(spot) for spot in spots],
+                             'x': np.asarray(x).tolist(),
+                             'x_hat': np.asarray(x_hat).tolist()
+                             })
+
+
+class JSONLMetrics(MemoryMetrics):
+    """
+    One JSON record per line, written through a large file buffer that is
+    only flushed when full or on close. replay.py sends it to visdom later.
+    With append, a resumed run carries on the log of the run it resumes
+    """
+
+    def __init__(self, path, buffering=2 ** 20, append=False):
+        super(JSONLMetrics, self).__init__()
+        self.file = open(path, 'a' if append else 'w', buffering=buffering)
+
+    def line(self, win, epochs, values):
+        super(JSONLMetrics, self).line(win, epochs, values)
+        self.flush_records()
+
+    def reconstruction(self, epoch, seg_idx, spots, x, x_hat):
+        super(JSONLMetrics, self).reconstruction(epoch, seg_idx, spots, x, x_hat)
+        self.flush_records()
+
+    def flush_records(self):
+        for record in self.records:
+            self.file.write(json.dumps(record) + '\n')
+        self.records = []
+
+    def close(self):
+        self.file.close()
+
+
+class VisdomMetrics(NullMetrics):
+    """
+    Loss curves and reconstruction figures on a visdom server. visdom and
+    matplotlib are imported, and the server connected to, on first use, so
+    from the reporter thread and never at start-up
+    """
+    enabled = True
+
+    def __init__(self, env, log_to_filename=None):
+        self.env = env
+        self.log_to_filename = log_to_filename
+        self._vis = None
+        self.figure = None
+
+    @property
+    def vis(self):
+        if self._vis is None:
+            import visdom
+            self._vis = visdom.Visdom(env=self.env, log_to_filename=self.log_to_filename)
+        return self._vis
+
+    def line(self, win, epochs, values):
+        self.vis.line(Y=np.array(values), X=np.array(epochs),
+                      win=win,
+                      opts=dict(title=win),
+                      update='append'
+                      )
+
+    def reconstruction(self, epoch, seg_idx, spots, x, x_hat):
+        # An Agg-backed Figure, pyplot's global state is not safe off the main thread
+        if self.figure is None:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            self.figure = Figure(figsize=(15, 15))
+            FigureCanvasAgg(self.figure)
+        self.figure.clear()
+        spots_l1, spots_l2 = np.hsplit(np.asarray(spots), 2)
+        for i, (spot_l1, spot_l2) in enumerate(zip(spots_l1, spots_l2)):
+            # L1 sensors
+            ax = self.figure.add_subplot(int(len(spots) / 2), 2, 2 * i + 1)
+            ax.plot(x[0][i], label='original')
+            ax.set_title('A-{}-{}'.format(spot_l1, seg_idx))
+            ax.plot(x_hat[0][i], label='reconstruct')
+            ax.axvline(x=127, ls='--', c='k')
+            ax.axvline(x=255, ls='--', c='k')
+            ax.legend(loc='upper center')
+            # L2 sensors
+            ax = self.figure.add_subplot(int(len(spots) / 2), 2, 2 * (i + 1))
+            ax.plot(x[1][i], label='original')
+            ax.set_title('A-{}-{}'.format(spot_l2, seg_idx))
+            ax.plot(x_hat[1][i], label='reconstruct')
+            ax.axvline(x=127, ls='--', c='k')
+            ax.axvline(x=255, ls='--', c='k')
+            ax.legend(loc='upper center')
+        self.figure.subplots_adjust(hspace=0.5)
+        self.vis.matplot(self.figure, win='Reconstruction', opts=dict(title='Epoch: {}'.format(epoch + 1)))
+
+    def close(self):
+        self.figure = None
+
+
+def make_metrics(kind, name, save_path='./results', resume=False):
+    """
+    :param kind: visdom, jsonl, memory or none
+    :param name: experiment file name, visdom env and log/JSONL file name
+    :param resume: append to the JSONL file of the run being resumed
+    """
+    if kind == 'visdom':
+        return VisdomMetrics(env=name, log_to_filename='{}/visualization/{}.log'.format(save_path, name))
+    elif kind == 'jsonl':
+        return JSONLMetrics('{}/visualization/{}.jsonl'.format(save_path, name), append=resume)
+    elif kind == 'memory':
+        return MemoryMetrics()
+    elif kind == 'none':
+        return NullMetrics()
+    raise ValueError('Unknown metrics sink: {}'.format(kind))
+
+
+def replay_jsonl(path, metrics):
+    """
+    Send the records of a JSONLMetrics file to another sink, e.g. visdom
+    """
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['type'] == 'line':
+                metrics.line(record['win'], record['X'], record['Y'])
+            elif record['type'] == 'reconstruction':
+                metrics.reconstruction(record['epoch'], record['seg_idx'], record['spots'],
+                                       np.array(record['x']), np.array(record['x_hat']))
@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 25/10/26 10:05 AM
+@description: Torch-free inference of AutoEncoders exported by utils.export
+@version: 1.0
+"""
+
+
+import json
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def conv(x, weight, bias, stride, padding):
+    """
+    :param x: [b, in, w]
+    :param weight: [out, in, k]
+    :return: [b, out, (w + 2 * padding - k) // stride + 1]
+    """
+    x = np.pad(x, ((0, 0), (0, 0), (padding, padding)))
+    windows = sliding_window_view(x, weight.shape[2], axis=2)[:, :, ::stride]  # [b, in, w_out, k]
+    return np.einsum('biwk,oik->bow', windows, weight, optimize=True) + bias[:, None]
+
+
+def deconv(x, weight, bias, stride, padding):
+    """
+    :param x: [b, in, w]
+    :param weight: [in, out, k], the ConvTranspose layout
+    :return: [b, out, (w - 1) * stride - 2 * padding + k]
+    """
+    b, _, w = x.shape
+    k = weight.shape[2]
+    y = np.zeros((b, weight.shape[1], (w - 1) * stride + k), dtype=x.dtype)
+    for tap in range(k):
+        y[:, :, tap: tap + (w - 1) * stride + 1: stride] += np.einsum('biw,io->bow', x, weight[:, :, tap], optimize=True)
+    return y[:, :, padding: y.shape[2] - padding] + bias[:, None]
+
+
+def sigmoid(x):
+    # Split by sign so exp never overflows
+    e = np.exp(-np.abs(x))
+    return np.where(x >= 0, 1 / (1 + e), e / (1 + e))
+
+
+def run(layers, params, x):
+    for i, layer in enumerate(layers):
+        op = layer['op']
+        if op == 'linear':
+            x = x @ params[i]['weight'].T + params[i]['bias']
+        elif op == 'conv':
+            x = conv(x, params[i]['weight'], params[i]['bias'], layer['stride'], layer['padding'])
+        elif op == 'deconv':
+            x = deconv(x, params[i]['weight'], params[i]['bias'], layer['stride'], layer['padding'])
+        elif op == 'leaky_relu':
+            x = np.where(x >= 0, x, x * np.float32(layer['slope']))
+        elif op == 'relu':
+            x = np.maximum(x, 0)
+        elif op == 'sigmoid':
+            x = sigmoid(x)
+        else:
+            raise ValueError('Unknown op: {}'.format(op))
+    return x.astype(np.float32, copy=False)
+
+
+def damage_index(loss, alpha):
+    return 1 - np.exp(- alpha * loss)
+
+
+class AutoEncoder:
+    """
+    forward of models.AutoEncoder from an exported .npz, needs NumPy only.
+    Conv2D inputs keep their [b, 3, 1, 128] layout, the height of 1 is
+    dropped internally and restored on the outputs
+    """
+
+    def __init__(self, path):
+        with np.load(path) as npz:
+            spec = json.loads(str(npz['spec']))
+            self.net_name = spec['net_name']
+            self.stacks = spec['stacks']
+            self.params = {name: [{key: npz['{}.{}.{}'.format(name, i, key)]
+                                   for key in ('weight', 'bias') if '{}.{}.{}'.format(name, i, key) in npz}
+                                  for i in range(len(layers))]
+                           for name, layers in self.stacks.items()}
+
+    def __call__(self, x):
+        return self.forward(x)
+
+    def stack(self, name, x):
+        return run(self.stacks[name], self.params[name], x)
+
+    def forward(self, x):
+        """
+        :return: output, z, z_hat as the torch model returns them
+        """
+        x = np.asarray(x, dtype=np.float32)
+        if self.net_name == 'Conv2D':
+            x = x.reshape(x.shape[0], x.shape[1], -1)
+            z = self.stack('encoder', x)
+            output = self.stack('decoder', z)
+            z_hat = self.stack('encoder_', output)
+            return output[:, :, None], z[:, :, None], z_hat[:, :, None]
+        z = self.stack('encoder', x)
+        output = self.stack('decoder', z)
+        z_hat = self.stack('encoder_', output)
+        return output, z, z_hat
+
+    def losses(self, x):
+        """
+        Per-segment reconstruction and latent losses, as test.DamageDetection.forward_losses
+        """
+        x = np.asarray(x, dtype=np.float32)
+        output, z, z_hat = self.forward(x)
+        loss_x = ((x.reshape(output.shape) - output) ** 2).reshape(x.shape[0], -1).mean(1)
+        loss_z = ((z - z_hat) ** 2).reshape(x.shape[0], -1).mean(1)
+        return loss_x, loss_z
+
+    def damage_index(self, x, alpha, beta):
+        """
+        Damage index of one spot from its segments x
+        """
+        loss_x, loss_z = self.losses(x)
+        loss = beta * loss_x.mean() + (1 - beta) * loss_z.mean()
+        return damage_index(loss, alpha)
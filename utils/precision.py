@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 22/10/26 2:10 PM
+@description: Reduced precision inference and its accuracy against fp32
+@version: 1.0
+"""
+
+
+import torch
+import numpy as np
+
+
+precisions = ('fp32', 'bf16', 'int8')
+
+
+def autocast(precision, device):
+    """
+    Autocast context for the forward pass, only enabled for bf16. The
+    parameters stay fp32 master weights, convolutions and linear layers run
+    in bf16 and BatchNorm keeps its fp32 affine parameters and running
+    statistics. int8 models quantize fp32 activations themselves
+    """
+    if precision not in precisions:
+        raise ValueError('Unknown precision: {}'.format(precision))
+    return torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16, enabled=precision == 'bf16')
+
+
+def tag(precision):
+    """
+    Suffix of the outputs written at a reduced precision, empty for fp32 so
+    the reference outputs keep their names
+    """
+    return '' if precision == 'fp32' else '_{}'.format(precision)
+
+
+def compare(reference, candidate, keys=('Reconstruction loss', 'Latent loss', 'Damage index')):
+    """
+    Per-spot accuracy of the losses and damage indices against the fp32 reference
+    :param reference: {spot: {key: value}}, as written by test.py
+    :param candidate: same spots, scored at a reduced precision
+    :return: {key: accuracy of that key}
+    """
+    return {key: compare_key(reference, candidate, key) for key in keys}
+
+
+def compare_key(reference, candidate, key):
+    spots = list(reference)
+    ref = np.array([reference[spot][key] for spot in spots])
+    cand = np.array([candidate[spot][key] for spot in spots])
+    errors = np.abs(cand - ref)
+    return {'Spots': {spot: {'Reference': float(r), 'Candidate': float(c), 'Abs error': float(e)}
+                      for spot, r, c, e in zip(spots, ref, cand, errors)},
+            'Max abs error': float(errors.max()),
+            'Mean abs error': float(errors.mean()),
+            'Max rel error': float((errors / np.maximum(np.abs(ref), np.finfo(np.float64).tiny)).max()),
+            # Damage localisation only depends on the order of the spots
+            'Same ranking': bool((np.argsort(ref, kind='stable') == np.argsort(cand, kind='stable')).all())
+            }
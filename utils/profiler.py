@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 27/10/26 4:40 PM
+@description: Per-epoch phase timers, histograms and Chrome traces for the trainers
+@version: 1.0
+"""
+
+
+import os
+import time
+import json
+import bisect
+import threading
+from contextlib import contextmanager
+import numpy as np
+import torch
+
+
+# Histogram bin edges in ms, log-spaced from 1 us to 100 s and shared by all phases
+bin_edges = [float(edge) for edge in np.logspace(-3, 5, 33)]
+
+
+class NullPhase:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+null_phase = NullPhase()
+
+
+class NullProfiler:
+    """
+    Profiling disabled: phase() hands back one shared no-op context and
+    iterate() the iterable itself, so the trainers pay an attribute lookup.
+    mark() and lap() trace away inside a torch.compile'd step
+    """
+    enabled = False
+
+    def phase(self, name):
+        return null_phase
+
+    def epoch(self, epoch):
+        return null_phase
+
+    def iterate(self, name, iterable):
+        return iterable
+
+    def mark(self):
+        pass
+
+    def lap(self, name):
+        pass
+
+    def summary(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class Phase:
+    __slots__ = ('profiler', 'name', 'start', 'record')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.record = None
+
+    def __enter__(self):
+        if self.profiler.sync:
+            torch.cuda.synchronize()
+        if self.profiler.torch_profile is not None:
+            # Shows the phase as a range in the torch.profiler trace too
+            self.record = torch.profiler.record_function(self.name)
+            self.record.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler.sync:
+            torch.cuda.synchronize()
+        end = time.perf_counter()
+        if self.record is not None:
+            self.record.__exit__(*exc)
+        self.profiler.add(self.name, self.start, end)
+        return False
+
+
+class PhaseProfiler(NullProfiler):
+    """
+    Wall time of named phases, kept as running count/total/max, a histogram
+    over bin_edges and a total per epoch. Phases may nest and may be timed
+    from other threads (e.g. the metrics reporter). Every epoch is a range
+    with its phase totals as counters in the Chrome trace at trace_path,
+    the epochs in profile_epochs also have each phase call as a range and
+    run under torch.profiler, whose trace goes to {trace_path}_epoch{n}.json
+    """
+    enabled = True
+
+    def __init__(self, trace_path=None, profile_epochs=(), sync=False):
+        """
+        :param profile_epochs: 1-based epochs traced in detail
+        :param sync: torch.cuda.synchronize() around each phase, so the
+                     times of asynchronous CUDA work land in the right phase
+        """
+        self.trace_path = trace_path
+        self.profile_epochs = set(profile_epochs)
+        self.sync = sync
+        self.t0 = time.perf_counter()
+        self.stats = {}
+        self.epochs = []
+        self.events = []
+        self.traced = False
+        self.torch_profile = None
+        self.lock = threading.Lock()
+        self.laps = threading.local()
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def mark(self):
+        """
+        Start the laps of this thread, for code where a with block does not fit
+        """
+        if self.sync:
+            torch.cuda.synchronize()
+        self.laps.start = time.perf_counter()
+
+    def lap(self, name):
+        """
+        Time since the previous mark() or lap() of this thread, as phase name
+        """
+        if self.sync:
+            torch.cuda.synchronize()
+        end = time.perf_counter()
+        self.add(name, self.laps.start, end)
+        self.laps.start = end
+
+    def iterate(self, name, iterable):
+        """
+        Time every next() of iterable, e.g. fetching a batch, as phase name
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                item = next(iterator, null_phase)
+            if item is null_phase:
+                return
+            yield item
+
+    def add(self, name, start, end):
+        duration = end - start
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = {'Count': 0,
+                                            'Total': 0.,
+                                            'Max': 0.,
+                                            'Counts': [0] * (len(bin_edges) - 1),
+                                            'Per epoch': {}
+                                            }
+            stats['Count'] += 1
+            stats['Total'] += duration
+            stats['Max'] = max(stats['Max'], duration)
+            b = bisect.bisect_right(bin_edges, duration * 1e3) - 1
+            stats['Counts'][min(max(b, 0), len(bin_edges) - 2)] += 1
+            epoch = self.epochs[-1] if self.epochs else 0
+            stats['Per epoch'][epoch] = stats['Per epoch'].get(epoch, 0.) + duration
+            if self.traced:
+                self.events.append(self.event(name, start, end))
+
+    def event(self, name, start, end, cat='phase'):
+        return {'name': name,
+                'cat': cat,
+                'ph': 'X',
+                'ts': (start - self.t0) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': os.getpid(),
+                'tid': threading.get_ident()
+                }
+
+    def epoch_trace_path(self, epoch):
+        return '{}_epoch{}.json'.format(os.path.splitext(self.trace_path)[0], epoch)
+
+    @contextmanager
+    def epoch(self, epoch):
+        """
+        :param epoch: 0-based epoch, as in the training loops
+        """
+        self.epochs.append(epoch + 1)
+        self.traced = epoch + 1 in self.profile_epochs
+        if self.traced:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.torch_profile = torch.profiler.profile(activities=activities)
+            self.torch_profile.__enter__()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            if self.torch_profile is not None:
+                self.torch_profile.__exit__(None, None, None)
+                if self.trace_path is not None:
+                    os.makedirs(os.path.dirname(self.trace_path), exist_ok=True)
+                    self.torch_profile.export_chrome_trace(self.epoch_trace_path(epoch + 1))
+                self.torch_profile = None
+            self.traced = False
+            with self.lock:
+                self.events.append(self.event('Epoch {}'.format(epoch + 1), start, end, cat='epoch'))
+                self.events.append({'name': 'Phase time (ms)',
+                                    'ph': 'C',
+                                    'ts': (end - self.t0) * 1e6,
+                                    'pid': os.getpid(),
+                                    'args': {name: stats['Per epoch'].get(epoch + 1, 0.) * 1e3
+                                             for name, stats in self.stats.items()}
+                                    })
+
+    def summary(self):
+        """
+        :return: the learning history entry, times in seconds, histogram edges in ms
+        """
+        with self.lock:
+            return {'Epochs': self.epochs,
+                    'Phases': {name: {'Count': stats['Count'],
+                                      'Total': stats['Total'],
+                                      'Mean': stats['Total'] / stats['Count'],
+                                      'Max': stats['Max'],
+                                      'Per epoch': [stats['Per epoch'].get(epoch, 0.) for epoch in self.epochs],
+                                      'Histogram': {'Edges': bin_edges, 'Counts': stats['Counts']}
+                                      }
+                               for name, stats in self.stats.items()}
+                    }
+
+    def close(self):
+        if self.trace_path is None:
+            return
+        os.makedirs(os.path.dirname(self.trace_path), exist_ok=True)
+        with self.lock, open(self.trace_path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+def make_profiler(enabled, profile_epochs=(), trace_path=None, sync=False):
+    """
+    PhaseProfiler when enabled or when epochs are sampled for torch.profiler,
+    NullProfiler otherwise
+    """
+    if enabled or profile_epochs:
+        return PhaseProfiler(trace_path=trace_path, profile_epochs=profile_epochs, sync=sync)
+    return NullProfiler()
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 27/10/26 3:10 PM
+@description: Persisted bank of generated healthy spectra for GAN damage scoring
+@version: 1.0
+"""
+
+
+import os
+import json
+import hashlib
+import numpy as np
+import torch
+
+
+def fingerprint(checkpoints, size, seed):
+    """
+    Hash of the size and modification time of the Generator and Discriminator
+    checkpoints and of the bank size and noise seed, retraining either
+    network or changing the bank gives a new fingerprint
+    """
+    entries = ['{}:{}'.format(size, seed)]
+    for path in checkpoints:
+        stat = os.stat(path)
+        entries.append('{}:{}:{}'.format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha1('\n'.join(entries).encode('utf-8')).hexdigest()
+
+
+def build(generator, discriminator, path, size, dim_noise, seed=0, batch_size=4096, fingerprint=None):
+    """
+    Generate size spectra from a fixed noise seed and write them with their
+    Discriminator scores to path (spectra) and its _scores.npy sibling, each
+    through a temp file renamed once complete. The fingerprint of the
+    networks goes to the _meta.json sibling, written last
+    """
+    rng = torch.Generator().manual_seed(seed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = '{}.{}.tmp.npy'.format(path[:-4], os.getpid())
+    bank, scores = None, np.zeros(size, dtype=np.float32)
+    with torch.no_grad():
+        for start in range(0, size, batch_size):
+            z = torch.randn(min(batch_size, size - start), dim_noise, generator=rng)
+            data_gen = generator(z)
+            if bank is None:
+                bank = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32,
+                                                 shape=(size, ) + tuple(data_gen.shape[1:]))
+            bank[start: start + z.size(0)] = data_gen.cpu().numpy()
+            scores[start: start + z.size(0)] = discriminator(data_gen).reshape(z.size(0)).cpu().numpy()
+    bank.flush()
+    del bank
+    np.save(scores_path(path), scores)
+    os.replace(tmp, path)
+    tmp = '{}.{}.tmp.json'.format(path[:-4], os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(json.dumps({'fingerprint': fingerprint, 'size': size, 'seed': seed}, indent=2))
+    os.replace(tmp, meta_path(path))
+
+
+def scores_path(path):
+    return '{}_scores.npy'.format(path[:-4])
+
+
+def meta_path(path):
+    return '{}_meta.json'.format(path[:-4])
+
+
+def is_current(path, fingerprint):
+    """
+    Whether the bank at path was built from the networks of fingerprint
+    """
+    try:
+        with open(meta_path(path)) as f:
+            return json.load(f)['fingerprint'] == fingerprint
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def load(path):
+    """
+    :return: memory-mapped bank [size, dim] and its Discriminator scores [size]
+    """
+    return np.load(path, mmap_mode='r'), np.load(scores_path(path), mmap_mode='r')
+
+
+def nearest(segments, bank, chunk_size=4096):
+    """
+    Nearest reference of every segment by mean squared residual, the bank is
+    streamed in chunks so only [num_segments, chunk_size] distances are held
+    :param segments: [num_segments, dim] tensor
+    :return: residual and index of the nearest reference per segment
+    """
+    segments = segments.reshape(segments.size(0), -1).float()
+    residual = torch.full((segments.size(0), ), float('inf'))
+    index = torch.zeros(segments.size(0), dtype=torch.long)
+    for start in range(0, bank.shape[0], chunk_size):
+        chunk = torch.from_numpy(np.array(bank[start: start + chunk_size])).reshape(-1, segments.size(1))
+        distances = torch.cdist(segments, chunk).pow_(2).div_(segments.size(1))
+        chunk_residual, chunk_index = distances.min(dim=1)
+        closer = chunk_residual < residual
+        residual = torch.where(closer, chunk_residual, residual)
+        index = torch.where(closer, chunk_index + start, index)
+    return residual, index
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 20/10/26 3:05 PM
+@description: Throttled background rendering of training snapshots
+@version: 1.0
+"""
+
+
+import time
+import queue
+import threading
+
+
+class AsyncReporter:
+    """
+    Renders snapshots on a background thread so plotting and visdom calls
+    never block training. Snapshots are taken at most once per `interval`
+    seconds (see due), and a snapshot still waiting to be rendered is
+    coalesced with the next one instead of queueing up behind a slow renderer
+    :param render: callable(snapshot), only ever called from the reporter thread
+    :param coalesce: callable(old, new) -> snapshot, keeps new by default
+    """
+
+    def __init__(self, render, interval=1.0, coalesce=None):
+        self.render = render
+        self.interval = interval
+        self.coalesce = coalesce or (lambda old, new: new)
+        self.queue = queue.Queue(maxsize=1)
+        self.last = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def due(self):
+        return self.last is None or time.time() - self.last >= self.interval
+
+    def submit(self, snapshot):
+        self.last = time.time()
+        try:
+            snapshot = self.coalesce(self.queue.get_nowait(), snapshot)
+        except queue.Empty:
+            pass
+        self.queue.put(snapshot)
+
+    def run(self):
+        while True:
+            snapshot = self.queue.get()
+            if snapshot is None:
+                return
+            try:
+                self.render(snapshot)
+            except Exception as e:  # A failing renderer must not take training down
+                print('Reporter: {}'.format(e))
+
+    def close(self):
+        """
+        Render whatever is still pending and stop the thread
+        """
+        self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 18/10/26 11:20 AM
+@description: Bounded buffers and sinks for streaming damage detection
+@version: 1.0
+"""
+
+
+import json
+from collections import deque
+import numpy as np
+from utils.fft_segmentation import spectra, layout
+
+
+class SpotBuffer:
+    """
+    Incoming samples of one spot, only the tail shorter than a window is
+    kept between chunks so memory is bounded by len_seg + chunk size
+    """
+
+    def __init__(self, len_seg, step=None, **normalization):
+        """
+        :param normalization: dc and scale of fft_segmentation.spectra
+        """
+        self.len_seg = len_seg
+        self.step = step or len_seg
+        self.normalization = normalization
+        self.samples = None
+
+    def push(self, chunk, net_name):
+        """
+        :param chunk: new samples, [num_channels, num_samples]
+        :return: spectra of the completed windows in the testset layout, or None
+        """
+        chunk = np.asarray(chunk, dtype=np.float32)
+        self.samples = chunk if self.samples is None else np.concatenate([self.samples, chunk], axis=-1)
+        num_seg = (self.samples.shape[-1] - self.len_seg) // self.step + 1
+        if num_seg < 1:
+            return None
+        x = layout(spectra(self.samples[None], self.len_seg, step=self.step, **self.normalization),
+                   net_name)[0][:num_seg]
+        self.samples = self.samples[:, num_seg * self.step:].copy()
+        return x
+
+
+class RollingLoss:
+    """
+    Mean reconstruction and latent loss over the last `window` segments
+    """
+
+    def __init__(self, window):
+        self.losses_x = deque(maxlen=window)
+        self.losses_z = deque(maxlen=window)
+        self.num_seg = 0
+
+    def update(self, losses_x, losses_z):
+        self.losses_x.extend(losses_x)
+        self.losses_z.extend(losses_z)
+        self.num_seg += len(losses_x)
+        return float(np.mean(self.losses_x)), float(np.mean(self.losses_z))
+
+
+class JSONLSink:
+    """
+    Append every record to a JSON lines file as soon as it is emitted
+    """
+
+    def __init__(self, path):
+        self.f = open(path, 'a')
+
+    def __call__(self, record):
+        self.f.write(json.dumps(record) + '\n')
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: Qun Yang
+@license: (C) Copyright 2021, University of Auckland
+@contact: qyan327@aucklanduni.ac.nz
+@date: 28/10/26 2:15 PM
+@description: White-noise responses of a multi-DOF shear structure by modal superposition
+@version: 1.0
+"""
+
+
+import numpy as np
+from utils.fft_segmentation import spectra, layout
+
+
+# Samples per seeded block of excitation, independent of how the record is chunked
+block_size = 2 ** 14
+
+
+def element_stiffness(num_dofs, damage=None):
+    """
+    :param damage: {element: stiffness reduction in [0, 1)}, element 0 ties
+                   DOF 0 to the ground, element e > 0 ties DOF e - 1 to DOF e
+    """
+    k = np.ones(num_dofs)
+    for element, reduction in (damage or {}).items():
+        if not 0 <= reduction < 1:
+            raise ValueError('Stiffness reduction of element {} must be in [0, 1): {}'.format(element, reduction))
+        k[element] *= 1 - reduction
+    return k
+
+
+def modes(k, num_modes, frequency):
+    """
+    Lowest modes of the unit-mass fixed-free chain with element stiffnesses
+    k, scaled so the undamaged chain of the same size has its fundamental
+    frequency at frequency
+    :return: natural circular frequencies [num_modes], mass-normalized mode
+             shapes [num_dofs, num_modes]
+    """
+    n = len(k)
+    K = np.diag(k + np.append(k[1:], 0))
+    K -= np.diag(k[1:], 1) + np.diag(k[1:], -1)
+    eigenvalues, shapes = np.linalg.eigh(K)
+    # Fundamental eigenvalue of the uniform unit chain is 4 sin^2(pi / (2 (2n + 1)))
+    scale = (2 * np.pi * frequency) ** 2 / (4 * np.sin(np.pi / (2 * (2 * n + 1))) ** 2)
+    return np.sqrt(eigenvalues[:num_modes] * scale), shapes[:, :num_modes]
+
+
+def modal_noise(seed, num_modes, start, stop):
+    """
+    Unit white-noise modal forces of samples [start, stop). Drawn in fixed
+    blocks seeded by (seed, block), so any range is reproducible on its own
+    and overlapping ranges of different chunks agree
+    """
+    blocks = [np.random.default_rng(seed + [block]).standard_normal((num_modes, block_size))
+              for block in range(start // block_size, (stop - 1) // block_size + 1)]
+    offset = start // block_size * block_size
+    return np.concatenate(blocks, axis=1)[:, start - offset: stop - offset]
+
+
+def modal_acceleration(forces, omega, zeta, fs):
+    """
+    Steady-state accelerations of the modal oscillators under forces,
+    through their frequency response -w^2 / (omega^2 - w^2 + 2i zeta omega w).
+    The product in frequency is a circular convolution whose sampled
+    impulse response also has a short acausal part, the caller discards a
+    margin on both ends long enough for the wrapped-around parts to decay
+    :param forces: [num_modes, num_samples]
+    """
+    w = 2 * np.pi * np.fft.rfftfreq(forces.shape[1], 1 / fs)
+    H = - w ** 2 / (omega[:, None] ** 2 - w ** 2 + 2j * zeta * omega[:, None] * w)
+    return np.fft.irfft(np.fft.rfft(forces, axis=1) * H, n=forces.shape[1], axis=1)
+
+
+def warmup(omega, zeta, fs, num_time_constants=8):
+    """
+    Samples for the slowest mode's transient to decay by exp(-num_time_constants)
+    """
+    return int(np.ceil(num_time_constants / (zeta * omega.min()) * fs))
+
+
+def response_rms(omega, shapes, zeta, fs, n=2 ** 16):
+    """
+    Stationary RMS of every DOF's acceleration under unit white-noise modal
+    forces, from the frequency response by Parseval: the modes are excited
+    independently so their variances add. Depends on no samples, so every
+    chunk of a record scales its sensor noise alike
+    :return: [num_dofs]
+    """
+    w = 2 * np.pi * np.fft.rfftfreq(n, 1 / fs)
+    power = np.abs(- w ** 2 / (omega[:, None] ** 2 - w ** 2 + 2j * zeta * omega[:, None] * w)) ** 2
+    # Mean over the full two-sided spectrum, the rfft bins other than DC and Nyquist stand for two
+    weights = np.full(len(w), 2.)
+    weights[0] = 1
+    if n % 2 == 0: weights[-1] = 1
+    variance = power @ weights / n
+    return np.sqrt(shapes ** 2 @ variance)
+
+
+def response_chunk(omega, shapes, start, stop, seed, zeta, fs, ratios, noise_ratio):
+    """
+    Accelerations of all DOFs in samples [start, stop) of the record, one
+    channel per direction. Direction c has the mode shapes of the chain and
+    its frequencies times ratios[c], with its own modal excitation. The
+    excitation and the sensor noise are drawn in seeded blocks and the noise
+    is scaled by the stationary RMS, so different chunkings of a record only
+    differ by the truncated tails of the modal impulse responses, about 1e-4
+    of the RMS at most, they are not identical sample for sample
+    :param seed: list of ints identifying the record
+    :return: [num_dofs, num_channels, stop - start] float32
+    """
+    num_warmup = warmup(omega * min(ratios), zeta, fs)
+    chunk = np.empty((shapes.shape[0], len(ratios), stop - start), dtype=np.float32)
+    for c, ratio in enumerate(ratios):
+        # Record sample t is excitation sample t + num_warmup, num_warmup more are dropped at the end
+        forces = modal_noise(seed + [c], len(omega), start, stop + 2 * num_warmup)
+        acceleration = modal_acceleration(forces, omega * ratio, zeta, fs)[:, num_warmup: num_warmup + stop - start]
+        chunk[:, c] = shapes.astype(np.float32) @ acceleration.astype(np.float32)
+        if noise_ratio > 0:
+            noise = modal_noise(seed + [len(ratios) + c], shapes.shape[0], start, stop).astype(np.float32)
+            rms = response_rms(omega * ratio, shapes, zeta, fs).astype(np.float32)
+            chunk[:, c] += noise_ratio * rms[:, None] * noise
+    return chunk
+
+
+def write_chunk(path, omega, shapes, start, stop, seed, zeta, fs, ratios, noise_ratio):
+    """
+    response_chunk into the [num_spots, num_channels, num_samples] .npy
+    file at path, safe to run from several processes
+    """
+    records = np.load(path, mmap_mode='r+')
+    records[:, :, start: stop] = response_chunk(omega, shapes, start, stop, seed, zeta, fs, ratios, noise_ratio)
+    records.flush()
+
+
+def write_segments(records_path, paths, spots, len_seg, num_seg):
+    """
+    Spectra of the spots [spots[0], spots[1]) into the train and test sets
+    of the MLP and Conv2D cache entries (paths[net_name]) and the raw entry
+    (paths['raw']), whose train array is the MLP test set as dataset_ is
+    """
+    records = np.load(records_path, mmap_mode='r')
+    amplitude = spectra(records[spots[0]: spots[1]], len_seg)
+    for net_name, entry in paths.items():
+        x = layout(amplitude, 'MLP' if net_name == 'raw' else net_name)
+        train = np.load(entry['train'], mmap_mode='r+')
+        if net_name == 'raw':
+            train[spots[0]: spots[1]] = x
+        else:
+            train[spots[0] * num_seg: spots[1] * num_seg] = x.reshape(-1, *x.shape[2:])
+            test = np.load(entry['test'], mmap_mode='r+')
+            test[spots[0]: spots[1]] = x
+            test.flush()
+        train.flush()